@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+import tempfile
+import resource
+import urllib.request
+
+# End-to-end throughput benchmark of dataset_cloner_service against the local
+# Luzmo stand-in (luzmo_stub/server.py).
+#
+# Usage:
+#   python benchmarks/cloner_benchmark.py --pairs 4,16 --columns 200 \
+#       --hierarchy-values 100,1000 --latency 0.02,0.1 --rate-429 0,0.02 \
+#       --output cloner_benchmark.json
+#
+# Every combination of the comma separated values is one scenario. Each
+# scenario starts its own stub and runs the cloner in a fresh process, so
+# limiters and caches start cold and peak RSS belongs to that run alone.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_SERVER = os.path.join(REPO_ROOT, "luzmo_stub", "server.py")
+CLONER_DIR = os.path.join(REPO_ROOT, "dataset_cloner_service")
+
+# Outcomes the request engine retries: throttling, gateway timeouts and
+# connection errors (recorded by exception name)
+RETRIED_STATUSES = {"429", "504"}
+
+SCENARIO_FIELDS = {
+    "pairs": int,
+    "columns": int,
+    "hierarchy_values": int,
+    "latency": float,
+    "rate_429": float,
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[int(fraction * (len(ordered) - 1))], 4)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(scenario, port, seed):
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            STUB_SERVER,
+            "--port", str(port),
+            "--seed", str(seed),
+            "--datasets", str(scenario["pairs"] + 1),
+            "--columns", str(scenario["columns"]),
+            "--hierarchy-values", str(scenario["hierarchy_values"]),
+            "--latency-median", str(scenario["latency"]),
+            "--rate-429", str(scenario["rate_429"]),
+            "--dashboards", "0",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(600):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stub/datasets") as r:
+                return stub, json.load(r)["dataset"]
+        except OSError:
+            time.sleep(0.1)
+    stub.kill()
+    raise RuntimeError("Luzmo stub did not start")
+
+
+async def measured_run(dataset_mapping):
+    """Clone ``dataset_mapping`` recording every HTTP attempt it makes."""
+    import aiohttp
+    import main
+
+    attempts = []
+
+    async def on_request_start(session, trace_config_ctx, params):
+        trace_config_ctx.sent_at = time.monotonic()
+
+    async def on_request_end(session, trace_config_ctx, params):
+        attempts.append(
+            (
+                params.url.path.rsplit("/", 1)[-1],
+                params.response.status,
+                time.monotonic() - trace_config_ctx.sent_at,
+            )
+        )
+
+    async def on_request_exception(session, trace_config_ctx, params):
+        attempts.append(
+            (
+                params.url.path.rsplit("/", 1)[-1],
+                type(params.exception).__name__,
+                time.monotonic() - trace_config_ctx.sent_at,
+            )
+        )
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+
+    started = time.monotonic()
+    async with aiohttp.ClientSession(trace_configs=[trace_config]) as session:
+        results = await main.clone_mapping(session, dataset_mapping)
+    wall = time.monotonic() - started
+    return main.run_summary(results, wall), attempts, wall
+
+
+def run_scenario(scenario, base_url, dataset_ids):
+    """Body of the cloner process: run one scenario and return its report."""
+    sys.path.insert(0, CLONER_DIR)
+    os.environ["LUZMO_BASE_URL"] = base_url
+    state_dir = tempfile.mkdtemp(prefix="cloner_benchmark_")
+    os.environ["TEMPLATE_CACHE_DIR"] = os.path.join(state_dir, "template_cache")
+    os.environ.pop("TEMPLATE_CACHE_BUCKET", None)
+    os.environ["FINGERPRINT_STORE_PATH"] = os.path.join(
+        state_dir, "fingerprints.sqlite3"
+    )
+    os.environ["PROGRESS_JOURNAL_PATH"] = os.path.join(state_dir, "progress.sqlite3")
+
+    summary, attempts, wall = asyncio.run(
+        measured_run({dataset_ids[0]: dataset_ids[1 : scenario["pairs"] + 1]})
+    )
+
+    endpoints = {}
+    for endpoint, status, latency in attempts:
+        stats = endpoints.setdefault(endpoint, {"requests": 0, "latencies": []})
+        stats["requests"] += 1
+        # Latency of successful responses only; instant 429s would pull it down
+        if str(status).startswith("2"):
+            stats["latencies"].append(latency)
+    statuses = {}
+    for _, status, _ in attempts:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "scenario": scenario,
+        "wall_seconds": round(wall, 3),
+        "requests": len(attempts),
+        "requests_per_second": round(len(attempts) / wall, 2) if wall else None,
+        "retries": sum(
+            count
+            for status, count in statuses.items()
+            if status in RETRIED_STATUSES or not status.isdigit()
+        ),
+        "statuses": statuses,
+        "endpoints": {
+            endpoint: {
+                "requests": stats["requests"],
+                "successes": len(stats["latencies"]),
+                "p50": percentile(stats["latencies"], 0.50),
+                "p95": percentile(stats["latencies"], 0.95),
+                "p99": percentile(stats["latencies"], 0.99),
+            }
+            for endpoint, stats in endpoints.items()
+        },
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "totals": summary["totals"],
+    }
+
+
+def benchmark(scenario, seed):
+    port = free_port()
+    stub, dataset_ids = start_stub(scenario, port, seed)
+    try:
+        cloner = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--run-scenario",
+                json.dumps(
+                    {
+                        "scenario": scenario,
+                        "base_url": f"http://127.0.0.1:{port}/0.1.0/",
+                        "dataset_ids": dataset_ids,
+                    }
+                ),
+            ],
+            capture_output=True,
+            text=True,
+            cwd=CLONER_DIR,
+        )
+    finally:
+        stub.terminate()
+        stub.wait()
+    if cloner.returncode != 0:
+        print(cloner.stderr[-2000:], file=sys.stderr)
+        return {"scenario": scenario, "error": f"exit status {cloner.returncode}"}
+    # The cloner prints its progress; the report is the last line
+    return json.loads(cloner.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=REPO_ROOT,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dataset cloner throughput benchmark")
+    parser.add_argument("--pairs", default="4")
+    parser.add_argument("--columns", default="200")
+    parser.add_argument("--hierarchy-values", default="500")
+    parser.add_argument("--latency", default="0.05")
+    parser.add_argument("--rate-429", default="0")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="cloner_benchmark.json")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_scenario:
+        job = json.loads(args.run_scenario)
+        report = run_scenario(job["scenario"], job["base_url"], job["dataset_ids"])
+        print(json.dumps(report))
+        return
+
+    grid = {
+        field: [cast(value) for value in getattr(args, field).split(",")]
+        for field, cast in SCENARIO_FIELDS.items()
+    }
+    started = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    reports = []
+    for values in itertools.product(*grid.values()):
+        scenario = dict(zip(grid, values))
+        print(f"Benchmarking {scenario}", file=sys.stderr)
+        report = benchmark(scenario, args.seed)
+        print(
+            f"  {report.get('wall_seconds')}s, {report.get('requests_per_second')} req/s, "
+            f"{report.get('retries')} retries, {report.get('peak_rss_mb')} MB",
+            file=sys.stderr,
+        )
+        reports.append(report)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "commit": git_commit(),
+                "started": started,
+                "results": reports,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Wrote {len(reports)} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,125 @@
 
 import os
 
-# "LUZMO_API_KEY", "LUZMO_TOKEN"
+# "LUZMO_API_KEY", "LUZMO_TOKEN", plus optional extra pairs
+# "LUZMO_API_KEY_2", "LUZMO_TOKEN_2" ... "LUZMO_API_KEY_9", "LUZMO_TOKEN_9"
 LUZMO_KnT_CREDENTIALS = [
     (
         os.getenv("LUZMO_API_KEY"),
         os.getenv("LUZMO_TOKEN"),
     ),
+] + [
+    (
+        os.getenv(f"LUZMO_API_KEY_{n}"),
+        os.getenv(f"LUZMO_TOKEN_{n}"),
+    )
+    for n in range(2, 10)
+    if os.getenv(f"LUZMO_API_KEY_{n}")
 ]
 
-luzmo_base_url = "https://api.us.cumul.io/0.1.0/"
+# Request budget of one key over a sliding window, and how long a key that
+# got a 429 without Retry-After is taken out of rotation
+LUZMO_KEY_WINDOW = 60  # seconds
+LUZMO_KEY_BUDGET = 600  # requests per window
+LUZMO_KEY_COOLDOWN = 30  # seconds
+
+# LUZMO_BASE_URL points the service at another API host, e.g. the local
+# stand-in in luzmo_stub/
+luzmo_base_url = os.getenv("LUZMO_BASE_URL", "https://api.us.cumul.io/0.1.0/")
 luzmo_endpoints = {
     "column_url": luzmo_base_url + "column",
     "securable_url": luzmo_base_url + "securable",
     "hierarchy_url": luzmo_base_url + "hierarchy",
 }
+
+# Sustained requests/second and burst size allowed per Luzmo endpoint and
+# API key. Shared by every coroutine in an invocation through request_engine.
+luzmo_rate_limits = {
+    "column_url": {"rate": 10, "burst": 20},
+    "securable_url": {"rate": 5, "burst": 10},
+    "hierarchy_url": {"rate": 5, "burst": 10},
+}
+
+# Maximum in-flight requests per Luzmo endpoint and API key, split into reads
+# ("get") and writes (everything else). Enforced across all dataset pairs of
+# a run.
+luzmo_concurrency_limits = {
+    "column_url": {"read": 16, "write": 8},
+    "securable_url": {"read": 8, "write": 4},
+    "hierarchy_url": {"read": 8, "write": 4},
+}
+
+# The caps above are ceilings: the live limit starts at half the ceiling and
+# is tuned by AIMD from observed 429/504s and p95 latency (see aimd.py)
+AIMD_MIN_LIMIT = 1
+AIMD_DECREASE_FACTOR = 0.5
+AIMD_LATENCY_TOLERANCE = 2.0  # p95 over this multiple of the best p95 backs off
+AIMD_LATENCY_SAMPLES = 50
+# Latency cuts in a row after which a p95 that is still high becomes the new
+# baseline: the server got slower, not our concurrency too high
+AIMD_REBASELINE_AFTER = 3
+
+# Templates processed at the same time by one invocation, and destinations
+# cloned at the same time from one template
+MAX_CONCURRENT_TEMPLATES = 6
+MAX_CONCURRENT_DESTINATIONS = 4
+
+# dataset_processor pipeline: workers per stage and the bounded queue between
+# the template fetch stage and the destination update stage
+PIPELINE_FETCH_WORKERS = 16
+PIPELINE_UPDATE_WORKERS = 16
+PIPELINE_QUEUE_SIZE = 32
+
+# Error records kept per dataset pair in the run summary
+RUN_SUMMARY_MAX_ERRORS = 20
+
+# Rows per page when bulk-reading all columns of a dataset
+COLUMN_PAGE_SIZE = 200
+
+# Hierarchy columns requested together in one hierarchy GET
+HIERARCHY_BATCH_SIZE = 20
+
+# Hierarchy updates are split into chunks of at most this many JSON bytes,
+# sent HIERARCHY_CHUNK_CONCURRENCY at a time per column. Chunks that still
+# fail after the request engine's retries are resent up to
+# HIERARCHY_CHUNK_ROUNDS times in total.
+HIERARCHY_CHUNK_BYTES = 256 * 1024
+HIERARCHY_CHUNK_CONCURRENCY = 4
+HIERARCHY_CHUNK_ROUNDS = 3
+
+# Template metadata cache. /tmp survives between invocations on a warm
+# instance; set TEMPLATE_CACHE_BUCKET to share the cache through GCS instead.
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "/tmp/template_cache")
+TEMPLATE_CACHE_BUCKET = os.getenv("TEMPLATE_CACHE_BUCKET")
+TEMPLATE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Hierarchy edits do not show in the dataset/column updated_at the cache is
+# versioned by, so cached hierarchies are re-read once they are this old
+TEMPLATE_CACHE_HIERARCHY_MAX_AGE = 15 * 60  # seconds
+
+# Invocation time budget. New work stops HANDOFF_MARGIN seconds before the
+# deadline and whatever is left is published to CLONER_TOPIC as a follow-up
+# message. A single request never waits longer than REQUEST_TIMEOUT.
+MAX_EXECUTION_TIME = 540  # Cloud function execution limit in seconds
+HANDOFF_MARGIN = 60
+REQUEST_TIMEOUT = 120
+CLONER_TOPIC = "insights_dataset_cloner"
+
+# Progress journal that lets a redelivered message skip finished updates
+PROGRESS_JOURNAL_PATH = os.getenv("PROGRESS_JOURNAL_PATH", "/tmp/cloner_progress.sqlite3")
+PROGRESS_JOURNAL_RETENTION = 7 * 24 * 3600  # seconds
+
+# Template fingerprint last applied to each dataset pair; a pair whose
+# template still has that fingerprint is skipped. Entries expire after
+# FINGERPRINT_MAX_AGE so every pair is fully compared at least that often.
+FINGERPRINT_STORE_PATH = os.getenv("FINGERPRINT_STORE_PATH", "/tmp/cloner_fingerprints.sqlite3")
+FINGERPRINT_MAX_AGE = 24 * 3600  # seconds
+
+# Pull worker (worker.py): subscription it reads, and flow control on the
+# messages held at once (a single message larger than WORKER_MAX_BYTES is
+# still processed, on its own)
+WORKER_SUBSCRIPTION = os.getenv("WORKER_SUBSCRIPTION", "insights_dataset_cloner-sub")
+WORKER_MAX_MESSAGES = 4
+WORKER_MAX_BYTES = 10 * 1024 * 1024
+# Seconds the worker keeps collecting messages after the first one of a batch
+# before merging them into one plan (0 processes every message on its own)
+AGGREGATION_WINDOW = float(os.getenv("AGGREGATION_WINDOW", "5"))
@@ -0,0 +1,56 @@
+import time
+import sqlite3
+
+
+class FingerprintStore:
+    """Template fingerprint last applied to each dataset pair.
+
+    A pair ("template:destination") is only recorded once every column and
+    hierarchy update of a run went through, so a matching fingerprint means the
+    destination already holds the template's current settings. Entries older
+    than ``max_age`` seconds no longer match, which forces a periodic full
+    comparison in case a destination was edited by hand.
+    """
+
+    def __init__(self, path, max_age):
+        self.max_age = max_age
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                pair TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                applied_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def matches(self, pair, fingerprint):
+        try:
+            row = self.connection.execute(
+                "SELECT fingerprint FROM fingerprints WHERE pair = ? AND applied_at >= ?",
+                (pair, time.time() - self.max_age),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Fingerprint store read failed for {pair}: {e}")
+            return False
+        return row is not None and row[0] == fingerprint
+
+    def record(self, pair, fingerprint):
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)",
+                (pair, fingerprint, time.time()),
+            )
+            self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Fingerprint store write failed for {pair}: {e}")
+
+    def forget(self, pair):
+        try:
+            self.connection.execute("DELETE FROM fingerprints WHERE pair = ?", (pair,))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Fingerprint store delete failed for {pair}: {e}")
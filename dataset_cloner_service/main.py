@@ -1,290 +1,239 @@
+import sys
 import base64
 import json
+import hashlib
 import asyncio
 import aiohttp
 import requests
 import time
-from itertools import cycle
 
 # import nest_asyncio
-from config import LUZMO_KnT_CREDENTIALS, luzmo_endpoints
+from config import (
+    MAX_CONCURRENT_TEMPLATES,
+    MAX_CONCURRENT_DESTINATIONS,
+    PIPELINE_FETCH_WORKERS,
+    PIPELINE_UPDATE_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    RUN_SUMMARY_MAX_ERRORS,
+    COLUMN_PAGE_SIZE,
+    HIERARCHY_BATCH_SIZE,
+    HIERARCHY_CHUNK_BYTES,
+    HIERARCHY_CHUNK_CONCURRENCY,
+    HIERARCHY_CHUNK_ROUNDS,
+    TEMPLATE_CACHE_DIR,
+    TEMPLATE_CACHE_BUCKET,
+    TEMPLATE_CACHE_MAX_BYTES,
+    TEMPLATE_CACHE_HIERARCHY_MAX_AGE,
+    CLONER_TOPIC,
+    PROGRESS_JOURNAL_PATH,
+    PROGRESS_JOURNAL_RETENTION,
+    FINGERPRINT_STORE_PATH,
+    FINGERPRINT_MAX_AGE,
+)
+from request_engine import (
+    DeadlineExceeded,
+    luzmo_request,
+    start_deadline,
+    out_of_time,
+    concurrency_summary,
+)
+from template_cache import TemplateCache, LocalDiskBackend, GCSBackend
+from progress_journal import ProgressJournal
+from fingerprint_store import FingerprintStore
 
-luzmo_cred_cycle = cycle(LUZMO_KnT_CREDENTIALS)
+# nest_asyncio.apply()
 
-LUZMO_KnT_call_count = 0
-KEYnTOKEN_SWAP_LIMIT = 100
-MAX_RETRIES = 5  # Maximum number of retries
-INITIAL_RETRY_DELAY = 2  # Initial delay for retries in seconds
-MAX_EXECUTION_TIME = 540  # Cloud function execution limit in seconds
-start_time = time.time()
+# Column fields that are never copied from the template to the destination
+EXCLUDED_COLUMN_FIELDS = [
+    "id",
+    "name",
+    "source_name",
+    "minBound",
+    "maxBound",
+    "cardinality",
+    "highestLevel",
+    "minimum",
+    "maximum",
+    "version",
+    "created_at",
+    "updated_at",
+    "securable_id",
+]
+
+
+def template_cache_backend():
+    """GCS bucket when one is configured and usable, else the local directory."""
+    if TEMPLATE_CACHE_BUCKET:
+        try:
+            return GCSBackend(TEMPLATE_CACHE_BUCKET)
+        except Exception as e:
+            print(
+                f"Template cache bucket {TEMPLATE_CACHE_BUCKET} unavailable, "
+                f"using {TEMPLATE_CACHE_DIR} instead: {e}"
+            )
+    return LocalDiskBackend(TEMPLATE_CACHE_DIR)
 
-# nest_asyncio.apply()
 
+template_cache = TemplateCache(
+    template_cache_backend(),
+    TEMPLATE_CACHE_MAX_BYTES,
+    TEMPLATE_CACHE_HIERARCHY_MAX_AGE,
+)
 
-def get_api_credentials():
-    global LUZMO_KnT_call_count
-    LUZMO_KnT_call_count += 1
-    if LUZMO_KnT_call_count % KEYnTOKEN_SWAP_LIMIT == 0:
-        return next(luzmo_cred_cycle)
-    else:
-        return LUZMO_KnT_CREDENTIALS[LUZMO_KnT_call_count % len(LUZMO_KnT_CREDENTIALS)]
+progress_journal = ProgressJournal(PROGRESS_JOURNAL_PATH, PROGRESS_JOURNAL_RETENTION)
 
+fingerprint_store = FingerprintStore(FINGERPRINT_STORE_PATH, FINGERPRINT_MAX_AGE)
 
-async def getDatasetJSON(session, dataset_id):
-    dataset_url = luzmo_endpoints["securable_url"]
 
+async def getDatasetJSON(session, dataset_id):
     get_dataset_json_payload = {
         "action": "get",
         "version": "0.1.0",
         "find": {"where": {"type": "dataset"}, "include": [{"model": "Column"}]},
     }
-
-    headers = {
-        "Content-Type": "application/json",
-    }
-
-    LUZMO_API_KEY, LUZMO_TOKEN = get_api_credentials()
-
-    get_dataset_json_payload["key"] = LUZMO_API_KEY
-    get_dataset_json_payload["token"] = LUZMO_TOKEN
     get_dataset_json_payload["find"]["where"]["id"] = dataset_id
 
-    retry_delay = INITIAL_RETRY_DELAY
-    start_time = time.time()
-
-    for attempt in range(MAX_RETRIES):
-        if (time.time() - start_time) >= MAX_EXECUTION_TIME:
-            print("Execution time limit exceeded, stopping retries.")
-            break
-
-        try:
-            async with session.post(
-                dataset_url, json=get_dataset_json_payload, headers=headers
-            ) as response:
-                if 200 <= response.status < 300:
-                    dataset_response_json = await response.json()
-                    print("API call successful, Got Dataset JSON for :", dataset_id)
-                    result_dict = {}
-                    heirarchy_dict = {}
-
-                    for item in dataset_response_json["rows"][0]["columns"]:
-                        name_en = item.get("name", {}).get("en", None)
-                        id_value = item.get("id", None)
-                        if item.get("type") == "hierarchy":
-                            heirarchy_dict[id_value] = name_en
-                        result_dict[id_value] = name_en
-
-                    return result_dict, heirarchy_dict
-                else:
-                    print(
-                        f"getDatasetJSON API call failed for dataset_id: {dataset_id} with status_code: {response.status}"
-                    )
+    dataset_response_json = await luzmo_request(
+        session,
+        "securable_url",
+        get_dataset_json_payload,
+        description=f"getDatasetJSON dataset_id: {dataset_id}",
+    )
+    if not (dataset_response_json or {}).get("rows"):
+        print("Dataset not found or unreadable:", dataset_id)
+        return False
+
+    print("API call successful, Got Dataset JSON for :", dataset_id)
+    result_dict = {}
+    heirarchy_dict = {}
+    column_records = {}
+
+    dataset_row = dataset_response_json["rows"][0]
+    for item in dataset_row["columns"]:
+        name_en = item.get("name", {}).get("en", None)
+        id_value = item.get("id", None)
+        if item.get("type") == "hierarchy":
+            heirarchy_dict[id_value] = name_en
+        result_dict[id_value] = name_en
+        column_records[id_value] = item
+
+    # Latest change to the dataset or any of its columns; used as the
+    # template cache version
+    version = max(
+        [str(dataset_row.get("updated_at"))]
+        + [str(item.get("updated_at")) for item in column_records.values()]
+    )
 
-        except aiohttp.ClientError as e:
-            print(f"Dataset Error making request: {e}")
-            if response.status in [429, 504]:  # Too Many Requests
-                print(
-                    f"Rate limit exceeded, retrying after {retry_delay} seconds... Status : {response.status}"
-                )
-                await asyncio.sleep(retry_delay)
-                retry_delay = min(
-                    retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                )
-            else:
-                return False
-    return False
+    return result_dict, heirarchy_dict, column_records, version
 
 
 async def fetch_column_data(session, column_id, column_name):
-    dataset_url = luzmo_endpoints["column_url"]
-
-    LUZMO_API_KEY, LUZMO_TOKEN = get_api_credentials()
-
     get_column_json_payload = {
         "action": "get",
         "version": "0.1.0",
         "find": {"where": {"id": column_id}},
-        "key": LUZMO_API_KEY,
-        "token": LUZMO_TOKEN,
     }
 
-    headers = {
-        "Content-Type": "application/json",
+    json_response = await luzmo_request(
+        session,
+        "column_url",
+        get_column_json_payload,
+        description=f"fetch_column_data column_id: {column_id}, column_name: {column_name}",
+    )
+    if json_response is None:
+        return None
+    return column_id, column_name, json_response
+
+
+def column_diff(template_column, dest_column):
+    """Template column properties that differ on the destination column.
+
+    Everything but EXCLUDED_COLUMN_FIELDS is sent when the destination column
+    record is unknown.
+    """
+    return {
+        field: value
+        for field, value in template_column.items()
+        if field not in EXCLUDED_COLUMN_FIELDS
+        and (dest_column is None or dest_column.get(field) != value)
     }
-    retry_delay = INITIAL_RETRY_DELAY
 
-    for attempt in range(MAX_RETRIES):
+
+async def fetch_dataset_columns(session, dataset_id):
+    """Full column records of a dataset, keyed by column id.
+
+    Reads the column endpoint page by page (the first page tells how many more
+    to request in parallel). Returns whatever could be read; callers fall back
+    to fetch_column_data for columns missing from the result.
+    """
+
+    def page_payload(offset):
+        return {
+            "action": "get",
+            "version": "0.1.0",
+            "find": {
+                "where": {"securable_id": dataset_id},
+                "limit": COLUMN_PAGE_SIZE,
+                "offset": offset,
+            },
+        }
+
+    async def fetch_page(offset):
         try:
-            async with session.post(
-                dataset_url, json=get_column_json_payload, headers=headers
-            ) as response:
-                if response.status in [429, 504]:  # Too Many Requests
-                    print(
-                        f"Rate limit exceeded, retrying after {retry_delay} seconds... Status : {response.status}"
-                    )
-                    await asyncio.sleep(retry_delay)
-                    retry_delay = min(
-                        retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                    )
-                    if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                        print("Execution time limit exceeded, stopping retries.")
-                        break
-                    continue
-                try:
-                    response.raise_for_status()
-                    json_response = await response.json()
-                    return column_id, column_name, json_response
-                except aiohttp.ClientResponseError as e:
-                    error_details = (
-                        await response.text()
-                    )  # Capture the error details from the response
-                    print(
-                        f"fetch_column_data API call failed for session_id: {session}, "
-                        f"column_id: {column_id}, column_name: {column_name} "
-                        f"with status: {response.status}, message: {e.message}, url: {e.request_info.url}, "
-                        f"error details: {error_details}"
-                    )
-                    break  # No point in retrying for client errors like 400 Bad Request
-        except aiohttp.ClientConnectionError as e:
-            print(
-                f"Connection error occurred for session_id: {session}, column_id: {column_id}, "
-                f"column_name: {column_name} on attempt {attempt + 1}/{MAX_RETRIES}: {str(e)}"
-            )
-            if attempt < MAX_RETRIES - 1:
-                await asyncio.sleep(retry_delay)
-                retry_delay = min(
-                    retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                )
-                if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                    print("Execution time limit exceeded, stopping retries.")
-                    break
-            else:
-                print(
-                    f"Failed to fetch column data for session_id: {session}, column_id: {column_id}, "
-                    f"column_name: {column_name} after {MAX_RETRIES} attempts."
-                )
-        except Exception as e:
-            print(
-                f"An unexpected error occurred for session_id: {session}, column_id: {column_id}, "
-                f"column_name: {column_name} with exception: {str(e)}"
+            return await luzmo_request(
+                session,
+                "column_url",
+                page_payload(offset),
+                description=f"fetch_dataset_columns dataset_id: {dataset_id}, offset: {offset}",
             )
-            break
+        except DeadlineExceeded:
+            # Left to the per-column fallback, which defers it
+            return None
+
+    first_page = await fetch_page(0)
+    if first_page is None:
+        return {}
+    pages = [first_page]
+    total = first_page.get("count", len(first_page.get("rows", [])))
+    if len(first_page.get("rows", [])) >= COLUMN_PAGE_SIZE:
+        pages += await asyncio.gather(
+            *[
+                fetch_page(offset)
+                for offset in range(COLUMN_PAGE_SIZE, total, COLUMN_PAGE_SIZE)
+            ]
+        )
 
-    # If we reach this point, either all retries have failed, or execution time was exceeded
-    return None
+    column_records = {}
+    for page in pages:
+        for row in (page or {}).get("rows", []):
+            column_records[row["id"]] = row
+    print(
+        f"Bulk fetched {len(column_records)}/{total} columns for dataset: {dataset_id}"
+    )
+    return column_records
 
 
 async def update_column_data(session, column_id, column_name, column_data):
-
-    LUZMO_API_KEY, LUZMO_TOKEN = get_api_credentials()
-
     update_column_json_payload = {
         "action": "update",
         "version": "0.1.0",
-        "key": LUZMO_API_KEY,
-        "token": LUZMO_TOKEN,
         "id": column_id,
         "properties": column_data,
     }
 
-    # Exclude fields which are commented out in the provided API call
-    excluded_fields = [
-        "id",
-        "name",
-        "source_name",
-        "minBound",
-        "maxBound",
-        "cardinality",
-        "highestLevel",
-        "minimum",
-        "maximum",
-        "version",
-        "created_at",
-        "updated_at",
-        "securable_id",
-    ]
-
     # Remove excluded fields from the payload
-    for field in excluded_fields:
+    for field in EXCLUDED_COLUMN_FIELDS:
         update_column_json_payload["properties"].pop(field, None)
 
-    for field in excluded_fields:
-        if field in update_column_json_payload["properties"]:
-            del update_column_json_payload["properties"][field]
-
-    update_url = luzmo_endpoints["column_url"]
-
-    headers = {
-        "Content-Type": "application/json",
-    }
-    # print(update_column_json_payload)
-    retry_delay = INITIAL_RETRY_DELAY
-
-    for attempt in range(MAX_RETRIES):
-        try:
-            async with session.post(
-                update_url, json=update_column_json_payload, headers=headers
-            ) as response:
-                if response.status in [429, 504]:  # Too Many Requests
-                    print(
-                        f"Rate limit exceeded, retrying after {retry_delay} seconds... Status : {response.status}"
-                    )
-                    await asyncio.sleep(retry_delay)
-                    retry_delay = min(
-                        retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                    )
-                    if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                        print("Execution time limit exceeded, stopping retries.")
-                        break
-                    continue
-                try:
-                    response.raise_for_status()
-                    return await response.json()
-                except aiohttp.ClientResponseError as e:
-                    error_details = (
-                        await response.text()
-                    )  # Capture the error details from the response
-                    print(
-                        f"update_column_data API call failed for session_id: {session}, "
-                        f"column_id: {column_id}, column_name: {column_name} "
-                        f"with status: {response.status}, message: {e.message}, url: {e.request_info.url}, "
-                        f"error details: {error_details}"
-                    )
-                    break  # No point in retrying for client errors like 400 Bad Request
-        except aiohttp.ClientConnectionError as e:
-            print(
-                f"Connection error occurred for session_id: {session}, column_id: {column_id}, "
-                f"column_name: {column_name} on attempt {attempt + 1}/{MAX_RETRIES}: {str(e)}"
-            )
-            if attempt < MAX_RETRIES - 1:
-                await asyncio.sleep(retry_delay)
-                retry_delay = min(
-                    retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                )
-                if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                    print("Execution time limit exceeded, stopping retries.")
-                    break
-            else:
-                print(
-                    f"Failed to update column data for session_id: {session}, column_id: {column_id}, "
-                    f"column_name: {column_name} after {MAX_RETRIES} attempts."
-                )
-        except Exception as e:
-            print(
-                f"An unexpected error occurred for session_id: {session}, column_id: {column_id}, "
-                f"column_name: {column_name} with exception: {str(e)}"
-            )
-            break
-
-        # If we reach this point, either all retries have failed, or execution time was exceeded
-        return None
+    return await luzmo_request(
+        session,
+        "column_url",
+        update_column_json_payload,
+        description=f"update_column_data column_id: {column_id}, column_name: {column_name}",
+    )
 
 
 async def fetch_hierarchy_data(session, column_id, dataset_id):
-    hierarchy_url = luzmo_endpoints["hierarchy_url"]
-
-    LUZMO_API_KEY, LUZMO_TOKEN = get_api_credentials()
-
     get_hierarchy_json_payload = {
         "action": "get",
         "version": "0.1.0",
@@ -294,168 +243,153 @@ async def fetch_hierarchy_data(session, column_id, dataset_id):
                 "securable_id": dataset_id,  # Template "651407a3-7f57-446c-b514-46c2d87f473a"
             }
         },
-        "key": LUZMO_API_KEY,
-        "token": LUZMO_TOKEN,
     }
 
-    headers = {
-        "Content-Type": "application/json",
-    }
+    json_response = await luzmo_request(
+        session,
+        "hierarchy_url",
+        get_hierarchy_json_payload,
+        description=f"fetch_hierarchy_data column_id: {column_id}, dataset_id: {dataset_id}",
+    )
+    if json_response is None:
+        return None
+    return column_id, json_response
 
-    retry_delay = INITIAL_RETRY_DELAY
-    for attempt in range(MAX_RETRIES):
-        try:
-            async with session.post(
-                hierarchy_url, json=get_hierarchy_json_payload, headers=headers
-            ) as response:
 
-                if response.status in [429, 504]:  # Too Many Requests
-                    print(
-                        f"Rate limit exceeded, retrying after {retry_delay} seconds... Status : {response.status}"
-                    )
-                    await asyncio.sleep(retry_delay)
-                    retry_delay = min(
-                        retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                    )
-                    if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                        print("Execution time limit exceeded, stopping retries.")
-                        break
-                    continue
-                try:
-                    response.raise_for_status()  # Raise an exception for HTTP error responses
-                    json_response = await response.json()
-
-                    return column_id, json_response
-                except aiohttp.ClientResponseError as e:
-                    error_details = (
-                        await response.text()
-                    )  # Capture the error details from the response
-                    print(
-                        f"fetch_hierarchy_data API call failed for session_id: {session}, "
-                        f"column_id: {column_id}, dataset_data: {dataset_id} "
-                        f"with status: {response.status}, message: {e.message}, url: {e.request_info.url}, "
-                        f"error details: {error_details}"
-                    )
-                    break  # No point in retrying for client errors like 400 Bad Request
+async def fetch_dataset_hierarchies(session, dataset_id, column_ids):
+    """Hierarchies of several columns of a dataset, keyed by column id.
 
-        except aiohttp.ClientConnectionError as e:
-            print(
-                f"Connection error occurred for session_id: {session}, column_id: {column_id}, "
-                f"dataset_id: {dataset_id} on attempt {attempt + 1}/{MAX_RETRIES}: {str(e)}"
-            )
-            if attempt < MAX_RETRIES - 1:
-                await asyncio.sleep(retry_delay)
-                retry_delay = min(
-                    retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                )
-                if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                    print("Execution time limit exceeded, stopping retries.")
-                    break
-            else:
-                print(
-                    f"Failed to fetch hierarchy data for session_id: {session}, column_id: {column_id}, "
-                    f"dataset_id: {dataset_id} after {MAX_RETRIES} attempts."
-                )
-        except Exception as e:
-            print(
-                f"An unexpected error occurred for session_id: {session}, column_id: {column_id}, "
-                f"dataset_id: {dataset_id} with exception: {str(e)}"
+    Requests the columns in HIERARCHY_BATCH_SIZE chunks and splits each
+    response back out on the nodes' column_id, giving every column the same
+    shape fetch_hierarchy_data returns. Columns that cannot be attributed are
+    left out so callers fall back to fetch_hierarchy_data for them.
+    """
+    column_ids = list(column_ids)
+
+    async def fetch_chunk(chunk):
+        get_hierarchy_json_payload = {
+            "action": "get",
+            "version": "0.1.0",
+            "find": {
+                "where": {
+                    "column_id": {"in": chunk},
+                    "securable_id": dataset_id,
+                }
+            },
+        }
+        try:
+            json_response = await luzmo_request(
+                session,
+                "hierarchy_url",
+                get_hierarchy_json_payload,
+                description=f"fetch_dataset_hierarchies dataset_id: {dataset_id}, columns: {len(chunk)}",
             )
-            break
-
-    # If we reach this point, either all retries have failed, or execution time was exceeded
-    return None
+        except DeadlineExceeded:
+            # Left to the per-column fallback, which defers it
+            json_response = None
+        hierarchies = {}
+        if not isinstance(json_response, list):
+            return hierarchies
+        for node in json_response:
+            column_id = node.get("column_id")
+            if column_id is None and len(chunk) == 1:
+                column_id = chunk[0]
+            if column_id in chunk:
+                hierarchies.setdefault(column_id, []).append(node)
+        return hierarchies
+
+    chunks = [
+        column_ids[i : i + HIERARCHY_BATCH_SIZE]
+        for i in range(0, len(column_ids), HIERARCHY_BATCH_SIZE)
+    ]
+    hierarchies = {}
+    for chunk_hierarchies in await asyncio.gather(*[fetch_chunk(c) for c in chunks]):
+        hierarchies.update(chunk_hierarchies)
+    print(
+        f"Batch fetched hierarchies for {len(hierarchies)}/{len(column_ids)} columns of dataset: {dataset_id}"
+    )
+    return hierarchies
+
+
+def hierarchy_chunks(hierarchy_data):
+    """Split hierarchy updates into lists of at most HIERARCHY_CHUNK_BYTES."""
+    chunks = []
+    current = []
+    current_size = 0
+    for item in hierarchy_data:
+        item_size = len(json.dumps(item))
+        if current and current_size + item_size > HIERARCHY_CHUNK_BYTES:
+            chunks.append(current)
+            current = []
+            current_size = 0
+        current.append(item)
+        current_size += item_size
+    if current:
+        chunks.append(current)
+    return chunks
 
 
 async def update_hierarchy_data(session, column_id, hierarchy_data):
+    """Send a column's hierarchy updates in size-bounded chunks.
 
-    LUZMO_API_KEY, LUZMO_TOKEN = get_api_credentials()
-
-    update_hierarchy_json_payload = {
-        "action": "update",
-        "version": "0.1.0",
-        "key": LUZMO_API_KEY,
-        "token": LUZMO_TOKEN,
-        "id": column_id,
-        "properties": {"updates": hierarchy_data},
-    }
-
-    update_url = luzmo_endpoints["hierarchy_url"]
-
-    headers = {
-        "Content-Type": "application/json",
-    }
-
-    retry_delay = INITIAL_RETRY_DELAY
-
-    for attempt in range(MAX_RETRIES):
-        try:
-            async with session.post(
-                update_url, json=update_hierarchy_json_payload, headers=headers
-            ) as response:
-                if response.status in [429, 504]:  # Too Many Requests
-                    print(
-                        f"Rate limit exceeded, retrying after {retry_delay} seconds... Status : {response.status}"
-                    )
-                    await asyncio.sleep(retry_delay)
-                    retry_delay = min(
-                        retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                    )
-                    if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                        print("Execution time limit exceeded, stopping retries.")
-                        break
-                    continue
-
-                try:
-                    response.raise_for_status()  # Raise an exception for HTTP error responses
-                    return await response.json()
-                except aiohttp.ClientResponseError as e:
-                    error_details = (
-                        await response.text()
-                    )  # Capture the error details from the response
-                    print(
-                        f"update_hierarchy_data API call failed for session_id: {session}, "
-                        f"column_id: {column_id}, hierarchy_data: {hierarchy_data} "
-                        f"with status: {response.status}, message: {e.message}, url: {e.request_info.url}, "
-                        f"error details: {error_details}"
-                    )
-                    break  # No point in retrying for client errors like 400 Bad Request
-        except aiohttp.ClientConnectionError as e:
-            print(
-                f"Connection error occurred for session_id: {session}, column_id: {column_id}, "
-                f"hierarchy_data: {hierarchy_data} on attempt {attempt + 1}/{MAX_RETRIES}: {str(e)}"
-                f"\n\n Payload: {json.dumps(update_hierarchy_json_payload)} \n\n"
-            )
-            if attempt < MAX_RETRIES - 1:
-                await asyncio.sleep(retry_delay)
-                retry_delay = min(
-                    retry_delay * 2, MAX_EXECUTION_TIME - (time.time() - start_time)
-                )
-                if (time.time() - start_time) + retry_delay >= MAX_EXECUTION_TIME:
-                    print("Execution time limit exceeded, stopping retries.")
-                    break
-            else:
-                print(
-                    f"Failed to update hierarchy data for session_id: {session}, column_id: {column_id}, "
-                    f"hierarchy_data: {hierarchy_data} after {MAX_RETRIES} attempts."
-                )
-        except Exception as e:
-            print(
-                f"An unexpected error occurred for session_id: {session}, column_id: {column_id}, "
-                f"hierarchy_data: {hierarchy_data} with exception: {str(e)}"
+    Each chunk is tracked on its own, so a retry round only resends the chunks
+    that failed. Returns the chunk responses in order, or None if any chunk
+    could not be written. Raises DeadlineExceeded once the chunks in flight
+    are done if any of them ran out of time.
+    """
+    chunks = hierarchy_chunks(hierarchy_data)
+    semaphore = asyncio.Semaphore(HIERARCHY_CHUNK_CONCURRENCY)
+    chunk_responses = {}
+
+    async def send_chunk(index):
+        update_hierarchy_json_payload = {
+            "action": "update",
+            "version": "0.1.0",
+            "id": column_id,
+            "properties": {"updates": chunks[index]},
+        }
+        async with semaphore:
+            chunk_responses[index] = await luzmo_request(
+                session,
+                "hierarchy_url",
+                update_hierarchy_json_payload,
+                description=f"update_hierarchy_data column_id: {column_id}, chunk: {index + 1}/{len(chunks)}",
             )
-            break
 
-    # If we reach this point, either all retries have failed, or execution time was exceeded
+    pending = list(range(len(chunks)))
+    for attempt in range(HIERARCHY_CHUNK_ROUNDS):
+        outcomes = await asyncio.gather(
+            *[send_chunk(index) for index in pending], return_exceptions=True
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+        pending = [index for index in pending if chunk_responses[index] is None]
+        if not pending:
+            return [chunk_responses[index] for index in range(len(chunks))]
+        print(
+            f"update_hierarchy_data column_id: {column_id}, {len(pending)}/{len(chunks)} "
+            f"chunks failed on round {attempt + 1}/{HIERARCHY_CHUNK_ROUNDS}"
+        )
+
+    print(f"Failed to update hierarchy for column_id: {column_id}, chunks: {pending}")
     return None
 
 
-async def parallelizer(session, task_info, function_to_call):
+async def parallelizer(session, task_info, function_to_call, limit=None):
+    # limit caps how many of these calls run at once; per-endpoint request
+    # caps are enforced separately by request_engine
     print("Parallelizer Initiailised with Function: ", str(function_to_call))
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def bounded(args):
+        async with semaphore:
+            return await function_to_call(session, *args)
+
     tasks = []
     for args in task_info:
         try:
-            task = function_to_call(session, *args)
+            task = bounded(args) if semaphore else function_to_call(session, *args)
             tasks.append(task)
         except Exception as e:
             print(f"Error calling function with arguments {args}: {e}")
@@ -465,12 +399,222 @@ async def parallelizer(session, task_info, function_to_call):
     return results
 
 
-async def dataset_processor(session, key_dataset_id, value_dataset_id):
-    print("Mapping Template from: ", key_dataset_id, "To: ", value_dataset_id)
-    template_columns, temp_heirarchy_cols = await getDatasetJSON(
-        session, key_dataset_id
+def column_update_info(dest_col_rev_dict, column_id, column_name, response):
+    try:
+        return (
+            dest_col_rev_dict[column_name],
+            column_name,
+            response["rows"][0],
+        )
+    except Exception as e:
+        print(
+            f"Error processing column update info for {column_id}, {column_name}: {e}"
+        )
+        return None
+
+
+def hierarchy_update_info(dest_col_rev_dict, template_columns, column_id, response):
+    try:
+        heir_resp = [
+            heir_item
+            for heir_item in response[0]["children"]
+            if heir_item["id"] is not None
+        ]
+        return (dest_col_rev_dict[template_columns[column_id]], heir_resp)
+    except Exception as e:
+        print(f"Error processing hierarchy update info for {column_id}: {e}")
+        return None
+
+
+async def load_template(session, template_dataset_id):
+    """Read a template dataset once for any number of destinations.
+
+    Columns and hierarchies come from the template cache when the template has
+    not changed since it was stored, otherwise from the bulk reads; expired
+    cached hierarchies are read again on their own. Returns None if the
+    template's dataset JSON cannot be read.
+    """
+    template_json = await getDatasetJSON(session, template_dataset_id)
+    if not template_json:
+        return None
+    template_columns, temp_heirarchy_cols, _, template_version = template_json
+
+    # Backend reads are blocking (file or GCS) and stay off the event loop
+    cached_template = await asyncio.get_running_loop().run_in_executor(
+        None, template_cache.get, template_dataset_id, template_version
     )
-    dest_columns, dest_heirarchy_cols = await getDatasetJSON(session, value_dataset_id)
+    if cached_template:
+        template_column_records, template_hierarchies = cached_template
+        if template_hierarchies is None:
+            template_hierarchies = await fetch_dataset_hierarchies(
+                session, template_dataset_id, temp_heirarchy_cols
+            )
+    else:
+        template_column_records, template_hierarchies = await asyncio.gather(
+            fetch_dataset_columns(session, template_dataset_id),
+            fetch_dataset_hierarchies(
+                session, template_dataset_id, temp_heirarchy_cols
+            ),
+        )
+
+    return {
+        "id": template_dataset_id,
+        "version": template_version,
+        "cached": bool(cached_template),
+        "hierarchies_cached": bool(cached_template) and cached_template[1] is not None,
+        "columns": template_columns,
+        "hierarchy_columns": temp_heirarchy_cols,
+        "column_records": template_column_records,
+        "hierarchies": template_hierarchies,
+        # Fallback fetches shared by every destination of this template
+        "fetches": {},
+    }
+
+
+async def template_column(session, template, column_id, column_name):
+    """Template column in the shape fetch_column_data returns."""
+    if column_id in template["column_records"]:
+        record = template["column_records"][column_id]
+        return column_id, column_name, {"count": 1, "rows": [record]}
+    if ("column", column_id) not in template["fetches"]:
+        template["fetches"][("column", column_id)] = asyncio.ensure_future(
+            fetch_column_data(session, column_id, column_name)
+        )
+    response = await template["fetches"][("column", column_id)]
+    if response is not None and response[2].get("rows"):
+        template["column_records"][column_id] = response[2]["rows"][0]
+    return response
+
+
+async def template_hierarchy(session, template, column_id):
+    """Template hierarchy in the shape fetch_hierarchy_data returns."""
+    if column_id in template["hierarchies"]:
+        return column_id, template["hierarchies"][column_id]
+    if ("hierarchy", column_id) not in template["fetches"]:
+        template["fetches"][("hierarchy", column_id)] = asyncio.ensure_future(
+            fetch_hierarchy_data(session, column_id, template["id"])
+        )
+    response = await template["fetches"][("hierarchy", column_id)]
+    if response is not None:
+        template["hierarchies"][column_id] = response[1]
+    return response
+
+
+def template_fingerprint(template):
+    """Hash of every template property that gets cloned to a destination.
+
+    Covers the copied properties of each column and the hierarchy of each
+    hierarchy column, keyed by column name since column ids differ between
+    datasets. None while the template reads are incomplete.
+    """
+    if not (
+        set(template["columns"]) <= set(template["column_records"])
+        and set(template["hierarchy_columns"]) <= set(template["hierarchies"])
+    ):
+        return None
+    contents = {
+        "columns": {
+            column_name: column_diff(template["column_records"][column_id], None)
+            for column_id, column_name in template["columns"].items()
+        },
+        "hierarchies": {
+            template["columns"][column_id]: template["hierarchies"][column_id]
+            for column_id in template["hierarchy_columns"]
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(contents, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+async def cache_template(template):
+    # Only complete reads are cached, partial ones would hide columns
+    if (
+        not (template["cached"] and template["hierarchies_cached"])
+        and set(template["columns"]) <= set(template["column_records"])
+        and set(template["hierarchy_columns"]) <= set(template["hierarchies"])
+    ):
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            template_cache.put,
+            template["id"],
+            template["version"],
+            template["column_records"],
+            template["hierarchies"],
+        )
+        template["cached"] = True
+        template["hierarchies_cached"] = True
+
+
+def pair_summary(key_dataset_id, value_dataset_id):
+    """Empty result of one dataset pair, filled in by dataset_processor."""
+    return {
+        "template": key_dataset_id,
+        "destination": value_dataset_id,
+        "status": "done",
+        "columns": {"skipped": 0, "patched": 0, "failed": 0, "resumed": 0},
+        "hierarchies": {"patched": 0, "failed": 0, "resumed": 0},
+        "deferred": {"columns": [], "hierarchies": []},
+        "errors": [],
+        "duration": 0.0,
+    }
+
+
+async def dataset_processor(
+    session,
+    key_dataset_id,
+    value_dataset_id,
+    template=None,
+    resume=None,
+    message_ids=(),
+):
+    """Clone column and hierarchy settings from a template dataset.
+
+    Returns a summary of the pair: status, counters, deferred column ids and
+    error records.
+    """
+    print("Mapping Template from: ", key_dataset_id, "To: ", value_dataset_id)
+    started = time.monotonic()
+    summary = pair_summary(key_dataset_id, value_dataset_id)
+    column_counts = summary["columns"]
+    hierarchy_counts = summary["hierarchies"]
+    deferred = summary["deferred"]
+
+    def finish(status):
+        summary["status"] = status
+        summary["duration"] = round(time.monotonic() - started, 2)
+        return summary
+
+    def record_error(kind, column_id, error):
+        (column_counts if kind == "column" else hierarchy_counts)["failed"] += 1
+        if len(summary["errors"]) < RUN_SUMMARY_MAX_ERRORS:
+            summary["errors"].append(
+                {"kind": kind, "column_id": column_id, "error": str(error)}
+            )
+
+    pair = f"{key_dataset_id}:{value_dataset_id}"
+    if template is None:
+        template = await load_template(session, key_dataset_id)
+    # Template unchanged since this pair was last cloned in full: the
+    # destination is not even read
+    if template and resume is None:
+        fingerprint = template.get("fingerprint") or template_fingerprint(template)
+        if fingerprint and fingerprint_store.matches(pair, fingerprint):
+            print(f"Fingerprint unchanged for {pair}, destination already in sync")
+            column_counts["skipped"] = len(template["columns"])
+            return finish("in_sync")
+    dest_json = await getDatasetJSON(session, value_dataset_id)
+    if not template or not dest_json:
+        print(
+            f"Skipping {key_dataset_id} -> {value_dataset_id}, could not read dataset columns"
+        )
+        summary["errors"].append(
+            {"kind": "dataset", "column_id": None, "error": "could not read dataset columns"}
+        )
+        return finish("unreadable")
+    template_columns = template["columns"]
+    temp_heirarchy_cols = template["hierarchy_columns"]
+    dest_columns, dest_heirarchy_cols, dest_column_records, _ = dest_json
 
     dest_col_rev_dict = {
         value_col_nm: key_col_id for key_col_id, value_col_nm in dest_columns.items()
@@ -478,74 +622,437 @@ async def dataset_processor(session, key_dataset_id, value_dataset_id):
     print("Src. Col Dict:", template_columns)
     print("Reverse Dest. Column Dict :", dest_col_rev_dict)
 
-    template_col_resp = await parallelizer(
-        session, [(k, v) for k, v in template_columns.items()], fetch_column_data
+    resume_columns = set(template_columns if resume is None else resume["columns"])
+    resume_hierarchies = set(
+        temp_heirarchy_cols if resume is None else resume["hierarchies"]
     )
+    if message_ids:
+        done = progress_journal.completed(message_ids, pair)
+        # Done by an earlier delivery of the same message: counted as resumed
+        column_counts["resumed"] = len(resume_columns & done["column"])
+        hierarchy_counts["resumed"] = len(resume_hierarchies & done["hierarchy"])
+        resume_columns -= done["column"]
+        resume_hierarchies -= done["hierarchy"]
+        if column_counts["resumed"] or hierarchy_counts["resumed"]:
+            print(
+                f"Progress journal: {pair} already has {column_counts['resumed']} columns "
+                f"and {hierarchy_counts['resumed']} hierarchies done, skipping them"
+            )
 
-    template_heirarchy_resp = await parallelizer(
-        session,
-        [
-            (heirarchy_col_id, key_dataset_id)
-            for heirarchy_col_id in temp_heirarchy_cols
-        ],
-        fetch_hierarchy_data,
-    )
+    def record_done(kind, column_id):
+        if message_ids:
+            progress_journal.record(message_ids, pair, kind, column_id)
 
-    dest_col_update_info = []
-    for column_id, column_name, response in template_col_resp:
+    fetch_queue = asyncio.Queue()
+    for column_id, column_name in template_columns.items():
+        if column_id in resume_columns or column_id in resume_hierarchies:
+            fetch_queue.put_nowait((column_id, column_name))
+    update_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    async def fetch_column(column_id, column_name):
         try:
-            item = (
-                dest_col_rev_dict[column_name],
-                column_name,
-                response["rows"][0],
-            )
-            dest_col_update_info.append(item)
-        except Exception as e:
-            print(
-                f"Error processing column update info for {column_id}, {column_name}: {e}"
-            )
+            response = await template_column(session, template, column_id, column_name)
+        except DeadlineExceeded:
+            deferred["columns"].append(column_id)
+            return
+        if response is None:
+            record_error("column", column_id, "could not read template column")
+            return
+        info = column_update_info(dest_col_rev_dict, *response)
+        if info is None:
+            record_error("column", column_id, f"no destination column {column_name}")
+            return
+        dest_column_id, column_name, column_data = info
+        patch = column_diff(column_data, dest_column_records.get(dest_column_id))
+        if not patch:
+            column_counts["skipped"] += 1
+            record_done("column", column_id)
+            return
+        await update_queue.put(
+            (update_column_data, (dest_column_id, column_name, patch), column_id)
+        )
 
-    dest_heirarchy_update_info = []
-    for column_id, response in template_heirarchy_resp:
+    async def fetch_hierarchy(column_id):
         try:
-            heir_resp = [
-                heir_item
-                for heir_item in response[0]["children"]
-                if heir_item["id"] is not None
-            ]
-            item = (dest_col_rev_dict[template_columns[column_id]], heir_resp)
-            dest_heirarchy_update_info.append(item)
-        except Exception as e:
-            print(f"Error processing hierarchy update info for {column_id}: {e}")
+            response = await template_hierarchy(session, template, column_id)
+        except DeadlineExceeded:
+            deferred["hierarchies"].append(column_id)
+            return
+        if response is None:
+            record_error("hierarchy", column_id, "could not read template hierarchy")
+            return
+        info = hierarchy_update_info(dest_col_rev_dict, template_columns, *response)
+        if info is None:
+            record_error("hierarchy", column_id, "no matching destination hierarchy")
+            return
+        await update_queue.put((update_hierarchy_data, info, column_id))
+
+    async def fetch_worker():
+        while not fetch_queue.empty():
+            column_id, column_name = fetch_queue.get_nowait()
+            wants_column = column_id in resume_columns
+            wants_hierarchy = (
+                column_id in temp_heirarchy_cols and column_id in resume_hierarchies
+            )
+            # Out of time: left for the follow-up run (see publish_followup)
+            if out_of_time():
+                if wants_column:
+                    deferred["columns"].append(column_id)
+                if wants_hierarchy:
+                    deferred["hierarchies"].append(column_id)
+                continue
+            chain = [fetch_column(column_id, column_name)] if wants_column else []
+            if wants_hierarchy:
+                chain.append(fetch_hierarchy(column_id))
+            try:
+                await asyncio.gather(*chain)
+            except Exception as e:
+                print(f"Error fetching template column {column_id}, {column_name}: {e}")
+                record_error("column", column_id, e)
+
+    async def update_worker():
+        while True:
+            job = await update_queue.get()
+            if job is None:
+                return
+            function_to_call, args, column_id = job
+            kind = "column" if function_to_call is update_column_data else "hierarchy"
+            if out_of_time():
+                deferred["columns" if kind == "column" else "hierarchies"].append(
+                    column_id
+                )
+                continue
+            try:
+                # Only success matters here; the response itself is dropped
+                succeeded = await function_to_call(session, *args) is not None
+                error = f"{kind} update failed"
+            except DeadlineExceeded:
+                deferred["columns" if kind == "column" else "hierarchies"].append(
+                    column_id
+                )
+                continue
+            except Exception as e:
+                print(f"Error calling {function_to_call.__name__} with {args[0]}: {e}")
+                succeeded = False
+                error = e
+            if succeeded:
+                (column_counts if kind == "column" else hierarchy_counts)["patched"] += 1
+                record_done(kind, column_id)
+            else:
+                record_error(kind, column_id, error)
 
-    update_col_resp = await parallelizer(
-        session, dest_col_update_info, update_column_data
-    )
+    update_workers = [
+        asyncio.create_task(update_worker()) for _ in range(PIPELINE_UPDATE_WORKERS)
+    ]
+    try:
+        await asyncio.gather(*[fetch_worker() for _ in range(PIPELINE_FETCH_WORKERS)])
+        for _ in update_workers:
+            await update_queue.put(None)
+        await asyncio.gather(*update_workers)
+    finally:
+        # No update outlives a pair that failed
+        for task in update_workers:
+            task.cancel()
+
+    # Fallback fetches may have completed the template reads by now. Only a
+    # run that compared every column itself vouches for the whole pair: a
+    # journaled update may predate changes made to the destination since.
+    fingerprint = template_fingerprint(template)
+    if column_counts["failed"] or hierarchy_counts["failed"]:
+        fingerprint_store.forget(pair)
+    elif (
+        fingerprint
+        and resume is None
+        and not deferred["columns"]
+        and not deferred["hierarchies"]
+        and not column_counts["resumed"]
+        and not hierarchy_counts["resumed"]
+    ):
+        fingerprint_store.record(pair, fingerprint)
 
-    update_heriarchy_resp = await parallelizer(
-        session, dest_heirarchy_update_info, update_hierarchy_data
+    print(
+        f"Pipeline done for {key_dataset_id} -> {value_dataset_id}: "
+        f"columns {column_counts}, hierarchies {hierarchy_counts}, "
+        f"deferred {len(deferred['columns'])} columns and {len(deferred['hierarchies'])} hierarchies"
     )
-
-    return (
-        template_col_resp,
-        template_heirarchy_resp,
-        update_col_resp,
-        update_heriarchy_resp,
+    if column_counts["failed"] or hierarchy_counts["failed"]:
+        return finish("failed")
+    if deferred["columns"] or deferred["hierarchies"]:
+        return finish("deferred")
+    return finish("done")
+
+
+def failed_summary(key_dataset_id, value_dataset_id, error, started):
+    """Result of a pair that stopped on an exception."""
+    fingerprint_store.forget(f"{key_dataset_id}:{value_dataset_id}")
+    summary = pair_summary(key_dataset_id, value_dataset_id)
+    summary["status"] = "failed"
+    summary["errors"].append(
+        {"kind": "dataset", "column_id": None, "error": str(error)}
     )
+    summary["duration"] = round(time.monotonic() - started, 2)
+    return summary
 
 
-async def main(dataset_mapping):
-    print("Main Fn : Dataset Mapping :", dataset_mapping)
-    async with aiohttp.ClientSession() as session:
+def deferred_summary(key_dataset_id, value_dataset_id, started):
+    """Result of a pair the invocation ran out of time for before it started.
+
+    No deferred column ids: publish_followup requests the whole pair again.
+    """
+    summary = pair_summary(key_dataset_id, value_dataset_id)
+    summary["status"] = "deferred"
+    summary["duration"] = round(time.monotonic() - started, 2)
+    return summary
+
+
+async def pair_processor(session, key_dataset_id, value_dataset_id, *args):
+    """dataset_processor that turns an exception into the pair's failure."""
+    started = time.monotonic()
+    try:
+        return await dataset_processor(
+            session, key_dataset_id, value_dataset_id, *args
+        )
+    except DeadlineExceeded as e:
+        print(f"Cloning {key_dataset_id} -> {value_dataset_id} deferred: {e}")
+        return deferred_summary(key_dataset_id, value_dataset_id, started)
+    except Exception as e:
+        print(f"Cloning {key_dataset_id} -> {value_dataset_id} failed: {e}")
+        return failed_summary(key_dataset_id, value_dataset_id, e, started)
+
+
+async def template_processor(
+    session, key_dataset_id, value_dataset_ids, resume=None, message_ids=None
+):
+    """Read a template once and clone it to every destination dataset.
+
+    A failure is reported on each of the template's pairs instead of raised,
+    so the other templates of a run still finish.
+    """
+    started = time.monotonic()
+    resume = resume or {}
+    message_ids = message_ids or {}
+    try:
+        template = await load_template(session, key_dataset_id)
+        if template:
+            template["fingerprint"] = template_fingerprint(template)
         results = await parallelizer(
             session,
             [
-                (key_dataset_id, value_dataset_id)
-                for key_dataset_id, value_dataset_id in dataset_mapping.items()
+                (
+                    key_dataset_id,
+                    value_dataset_id,
+                    template,
+                    resume.get(f"{key_dataset_id}:{value_dataset_id}"),
+                    message_ids.get(f"{key_dataset_id}:{value_dataset_id}", ()),
+                )
+                for value_dataset_id in value_dataset_ids
             ],
-            dataset_processor,
+            pair_processor,
+            limit=MAX_CONCURRENT_DESTINATIONS,
         )
-    return results
+        if template:
+            await cache_template(template)
+        return results
+    except DeadlineExceeded as e:
+        print(f"Cloning template {key_dataset_id} deferred: {e}")
+        return [
+            deferred_summary(key_dataset_id, value_dataset_id, started)
+            for value_dataset_id in value_dataset_ids
+        ]
+    except Exception as e:
+        print(f"Cloning template {key_dataset_id} failed: {e}")
+        return [
+            failed_summary(key_dataset_id, value_dataset_id, e, started)
+            for value_dataset_id in value_dataset_ids
+        ]
+
+
+def destination_lists(dataset_mapping):
+    """Normalise {template: dest} and {template: [dests]} payloads to lists."""
+    return {
+        key_dataset_id: (
+            [value_dataset_ids]
+            if isinstance(value_dataset_ids, str)
+            else list(dict.fromkeys(value_dataset_ids))
+        )
+        for key_dataset_id, value_dataset_ids in dataset_mapping.items()
+    }
+
+
+def message_error(json_data):
+    """Why a cloner message cannot be cloned, or None if it can.
+
+    The payload must map template ids to a destination id or a list of them;
+    a resume, if any, maps "template:destination" to column id lists.
+    """
+    payload = json_data.get("payload") if isinstance(json_data, dict) else None
+    if not isinstance(payload, dict):
+        return "payload is not a template -> destinations mapping"
+    for key_dataset_id, value_dataset_ids in payload.items():
+        if not isinstance(value_dataset_ids, str) and not (
+            isinstance(value_dataset_ids, list)
+            and all(isinstance(value, str) for value in value_dataset_ids)
+        ):
+            return f"destinations of {key_dataset_id} are not dataset ids"
+    resume = json_data.get("resume")
+    if resume is not None and not (
+        isinstance(resume, dict)
+        and all(
+            isinstance(pair_resume, dict)
+            and all(
+                isinstance(pair_resume.get(kind), list)
+                for kind in ["columns", "hierarchies"]
+            )
+            for pair_resume in resume.values()
+        )
+    ):
+        return "resume is not a pair -> deferred column ids mapping"
+    return None
+
+
+def journal_keys(dataset_mapping, message_id):
+    """Progress journal keys of a single message: every pair under its id."""
+    return {
+        f"{key_dataset_id}:{value_dataset_id}": [message_id]
+        for key_dataset_id, value_dataset_ids in destination_lists(
+            dataset_mapping
+        ).items()
+        for value_dataset_id in value_dataset_ids
+    }
+
+
+def merge_mappings(messages):
+    """Merge cloner messages into one deduplicated template -> destinations plan.
+
+    Returns (payload, resume). A pair requested in full by any message runs in
+    full; otherwise the deferred column ids of all its messages are combined.
+    """
+    payload = {}
+    resume = {}
+    full_pairs = set()
+    for json_data in messages:
+        message_resume = json_data.get("resume") or {}
+        for key_dataset_id, value_dataset_ids in destination_lists(
+            json_data["payload"]
+        ).items():
+            destinations = payload.setdefault(key_dataset_id, [])
+            for value_dataset_id in value_dataset_ids:
+                if value_dataset_id not in destinations:
+                    destinations.append(value_dataset_id)
+                pair = f"{key_dataset_id}:{value_dataset_id}"
+                if pair not in message_resume:
+                    full_pairs.add(pair)
+                    continue
+                merged = resume.setdefault(pair, {"columns": [], "hierarchies": []})
+                for kind in ["columns", "hierarchies"]:
+                    merged[kind] = list(
+                        dict.fromkeys(merged[kind] + message_resume[pair][kind])
+                    )
+    for pair in full_pairs:
+        resume.pop(pair, None)
+    return payload, resume
+
+
+async def clone_mapping(session, dataset_mapping, resume=None, message_ids=None):
+    """Clone every template of ``dataset_mapping`` to its destinations.
+
+    ``resume`` maps "template:destination" to the template column ids an
+    earlier run deferred for that pair; pairs without an entry run fully.
+    ``message_ids`` maps a pair to the ids of the messages that asked for it;
+    progress is journaled under each of them, so a redelivered message skips
+    the updates an earlier delivery finished. Returns one summary per dataset
+    pair (see dataset_processor).
+    """
+    template_results = await parallelizer(
+        session,
+        [
+            (key_dataset_id, value_dataset_ids, resume, message_ids)
+            for key_dataset_id, value_dataset_ids in destination_lists(
+                dataset_mapping
+            ).items()
+        ],
+        template_processor,
+        limit=MAX_CONCURRENT_TEMPLATES,
+    )
+    # One result per dataset pair, in payload order
+    return [result for results in template_results for result in results]
+
+
+async def main(dataset_mapping, resume=None, message_id=None):
+    print("Main Fn : Dataset Mapping :", dataset_mapping)
+    start_deadline()
+    message_ids = journal_keys(dataset_mapping, message_id) if message_id else None
+    async with aiohttp.ClientSession() as session:
+        return await clone_mapping(session, dataset_mapping, resume, message_ids)
+
+
+def run_summary(results, duration):
+    """Totals over the per-pair summaries of a run, plus the pairs themselves."""
+    totals = {"pairs": len(results), "status": {}}
+    for result in results:
+        totals["status"][result["status"]] = totals["status"].get(result["status"], 0) + 1
+        for kind in ["columns", "hierarchies"]:
+            for counter, value in result[kind].items():
+                totals[f"{kind}_{counter}"] = totals.get(f"{kind}_{counter}", 0) + value
+    return {
+        "duration": round(duration, 2),
+        "totals": totals,
+        "pairs": results,
+        "concurrency": concurrency_summary(),
+    }
+
+
+def message_key(json_data, context):
+    """Id that stays the same when Pub/Sub redelivers a message, or None.
+
+    Only a delivery id will do: two requests with the same body are separate
+    requests, and the second must not skip what the first already updated.
+    """
+    delivery_id = getattr(context, "event_id", None) or json_data.get("messageId")
+    return str(delivery_id) if delivery_id else None
+
+
+def followup_message(json_data, results):
+    """Cloner message for the deferred work of ``results``, or None if none."""
+    payload = {}
+    resume = {}
+    for result in results:
+        deferred = result["deferred"]
+        if deferred["columns"] or deferred["hierarchies"]:
+            resume[f"{result['template']}:{result['destination']}"] = {
+                "columns": deferred["columns"],
+                "hierarchies": deferred["hierarchies"],
+            }
+        elif result["status"] != "deferred":
+            continue
+        # Without a resume entry the pair is cloned in full
+        payload.setdefault(result["template"], []).append(result["destination"])
+    if not payload:
+        return None
+    return dict(json_data, payload=payload, resume=resume)
+
+
+def publish_followup(json_data, results):
+    """Publish the deferred work of ``results`` as a new cloner message."""
+    message = followup_message(json_data, results)
+    if message is None:
+        return None
+
+    import google.auth
+    from google.cloud import pubsub_v1
+
+    _, project_id = google.auth.default()
+    publisher = pubsub_v1.PublisherClient()
+    topic_path = publisher.topic_path(project_id, CLONER_TOPIC)
+    message_id = publisher.publish(
+        topic_path, json.dumps(message).encode("utf-8")
+    ).result()
+    pairs = sum(len(destinations) for destinations in message["payload"].values())
+    print(
+        f"Out of time, published follow-up for {pairs} dataset pairs "
+        f"to {topic_path}, message ID: {message_id}"
+    )
+    return message_id
 
 
 # async def parallelizer(task_info, function_to_call):
@@ -652,7 +1159,18 @@ def hello_pubsub(event, context):
         json_data["payload"],
     )
     # json_data = event
-    return asyncio.run(main(json_data["payload"]))
+    started = time.monotonic()
+    results = asyncio.run(
+        main(
+            json_data["payload"],
+            json_data.get("resume"),
+            message_key(json_data, context),
+        )
+    )
+    summary = run_summary(results, time.monotonic() - started)
+    print("Run Summary:", json.dumps(summary))
+    publish_followup(json_data, results)
+    return summary
 
 
 task_payload = {
@@ -686,4 +1204,15 @@ task_payload = {
     },
 }
 
-hello_pubsub(task_payload, "context")
+# Usage: python main.py [mapping.json]
+# mapping.json is a cloner message ({"payload": {...}}) or the mapping itself;
+# without it the task_payload above is cloned.
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            message = json.load(f)
+        if "payload" not in message:
+            message = {"client_id": None, "dash_type": None, "payload": message}
+        hello_pubsub(message, "context")
+    else:
+        hello_pubsub(task_payload, "context")
@@ -0,0 +1,255 @@
+import sys
+import json
+import math
+import asyncio
+import aiohttp
+
+from config import (
+    LUZMO_KnT_CREDENTIALS,
+    LUZMO_KEY_WINDOW,
+    LUZMO_KEY_BUDGET,
+    luzmo_rate_limits,
+    COLUMN_PAGE_SIZE,
+    HIERARCHY_BATCH_SIZE,
+)
+from main import (
+    getDatasetJSON,
+    load_template,
+    template_column,
+    template_hierarchy,
+    template_fingerprint,
+    column_update_info,
+    hierarchy_update_info,
+    column_diff,
+    hierarchy_chunks,
+    destination_lists,
+    fingerprint_store,
+)
+
+# Usage: python planner.py mapping.json [plan.json]
+# mapping.json is a cloner message ({"payload": {...}}) or the mapping itself.
+# Without an output path the plan is printed as the last line of stdout.
+
+
+def new_request_counts():
+    return {endpoint: {"read": 0, "write": 0} for endpoint in luzmo_rate_limits}
+
+
+def payload_bytes(payload):
+    return len(json.dumps(payload))
+
+
+def template_read_counts(template):
+    """Reads a run needs for a template, including fallbacks for bulk misses."""
+    counts = new_request_counts()
+    counts["securable_url"]["read"] += 1
+    if template["cached"]:
+        if not template["hierarchies_cached"]:
+            counts["hierarchy_url"]["read"] += math.ceil(
+                len(template["hierarchy_columns"]) / HIERARCHY_BATCH_SIZE
+            )
+        return counts
+    missing_columns = set(template["columns"]) - set(template["column_records"])
+    missing_hierarchies = set(template["hierarchy_columns"]) - set(
+        template["hierarchies"]
+    )
+    counts["column_url"]["read"] += (
+        max(1, math.ceil(len(template["column_records"]) / COLUMN_PAGE_SIZE))
+        + len(missing_columns)
+    )
+    counts["hierarchy_url"]["read"] += (
+        math.ceil(len(template["hierarchy_columns"]) / HIERARCHY_BATCH_SIZE)
+        + len(missing_hierarchies)
+    )
+    return counts
+
+
+async def plan_pair(session, template, value_dataset_id):
+    """Updates a run would make for one pair, without making any of them."""
+    key_dataset_id = template["id"]
+    pair_plan = {
+        "template": key_dataset_id,
+        "destination": value_dataset_id,
+        "status": "planned",
+        "column_updates": [],
+        "hierarchy_updates": [],
+        "unmatched_columns": [],
+        "columns_in_sync": 0,
+        "requests": new_request_counts(),
+        "payload_bytes": 0,
+    }
+    pair = f"{key_dataset_id}:{value_dataset_id}"
+    fingerprint = template_fingerprint(template)
+    if fingerprint and fingerprint_store.matches(pair, fingerprint):
+        pair_plan["status"] = "in_sync"
+        return pair_plan
+
+    pair_plan["requests"]["securable_url"]["read"] += 1
+    dest_json = await getDatasetJSON(session, value_dataset_id)
+    if not dest_json:
+        pair_plan["status"] = "unreadable"
+        return pair_plan
+    dest_columns, _, dest_column_records, _ = dest_json
+    dest_col_rev_dict = {
+        value_col_nm: key_col_id for key_col_id, value_col_nm in dest_columns.items()
+    }
+
+    for column_id, column_name in template["columns"].items():
+        response = await template_column(session, template, column_id, column_name)
+        info = column_update_info(dest_col_rev_dict, *response) if response else None
+        if info is None:
+            pair_plan["unmatched_columns"].append(column_name)
+            continue
+        dest_column_id, _, column_data = info
+        patch = column_diff(column_data, dest_column_records.get(dest_column_id))
+        if not patch:
+            pair_plan["columns_in_sync"] += 1
+            continue
+        size = payload_bytes(
+            {
+                "action": "update",
+                "version": "0.1.0",
+                "id": dest_column_id,
+                "properties": patch,
+            }
+        )
+        pair_plan["column_updates"].append(
+            {
+                "template_column_id": column_id,
+                "destination_column_id": dest_column_id,
+                "column_name": column_name,
+                "properties": sorted(patch),
+                "bytes": size,
+            }
+        )
+        pair_plan["requests"]["column_url"]["write"] += 1
+        pair_plan["payload_bytes"] += size
+
+    for column_id in template["hierarchy_columns"]:
+        response = await template_hierarchy(session, template, column_id)
+        info = (
+            hierarchy_update_info(dest_col_rev_dict, template["columns"], *response)
+            if response
+            else None
+        )
+        if info is None:
+            continue
+        dest_column_id, hierarchy_data = info
+        chunks = hierarchy_chunks(hierarchy_data)
+        size = sum(
+            payload_bytes(
+                {
+                    "action": "update",
+                    "version": "0.1.0",
+                    "id": dest_column_id,
+                    "properties": {"updates": chunk},
+                }
+            )
+            for chunk in chunks
+        )
+        pair_plan["hierarchy_updates"].append(
+            {
+                "template_column_id": column_id,
+                "destination_column_id": dest_column_id,
+                "column_name": template["columns"][column_id],
+                "values": len(hierarchy_data),
+                "chunks": len(chunks),
+                "bytes": size,
+            }
+        )
+        pair_plan["requests"]["hierarchy_url"]["write"] += len(chunks)
+        pair_plan["payload_bytes"] += size
+    return pair_plan
+
+
+def estimate_runtime(request_counts):
+    """Lower bound on run time in seconds from the configured rate limits.
+
+    Each endpoint drains its requests at its sustained rate once the burst is
+    spent, spread over every API key; the per-key request budget bounds the
+    total as well. Endpoints run in parallel, so the slowest one counts.
+    """
+    keys = len(LUZMO_KnT_CREDENTIALS)
+    per_endpoint = {}
+    for endpoint, counts in request_counts.items():
+        limits = luzmo_rate_limits[endpoint]
+        requests = counts["read"] + counts["write"]
+        per_endpoint[endpoint] = round(
+            max(0, requests - limits["burst"] * keys) / (limits["rate"] * keys), 2
+        )
+    total_requests = sum(
+        counts["read"] + counts["write"] for counts in request_counts.values()
+    )
+    key_budget = round(
+        max(0, total_requests - LUZMO_KEY_BUDGET * keys)
+        * LUZMO_KEY_WINDOW
+        / (LUZMO_KEY_BUDGET * keys),
+        2,
+    )
+    return {
+        "seconds": max([key_budget] + list(per_endpoint.values())),
+        "per_endpoint": per_endpoint,
+        "key_budget": key_budget,
+    }
+
+
+def add_request_counts(total, counts):
+    for endpoint, modes in counts.items():
+        for mode, value in modes.items():
+            total[endpoint][mode] += value
+
+
+async def plan(dataset_mapping):
+    """Dry run of ``dataset_mapping``: only reads, never writes.
+
+    Returns a JSON-serialisable plan with every column and hierarchy update
+    per dataset pair, and per template and overall the estimated requests by
+    endpoint and mode, payload bytes and run time.
+    """
+    plan_result = {"templates": [], "requests": new_request_counts(), "payload_bytes": 0}
+    async with aiohttp.ClientSession() as session:
+        for key_dataset_id, value_dataset_ids in destination_lists(
+            dataset_mapping
+        ).items():
+            template = await load_template(session, key_dataset_id)
+            if not template:
+                plan_result["templates"].append(
+                    {"template": key_dataset_id, "status": "unreadable", "pairs": []}
+                )
+                continue
+            template_plan = {
+                "template": key_dataset_id,
+                "status": "planned",
+                "columns": len(template["columns"]),
+                "hierarchy_columns": len(template["hierarchy_columns"]),
+                "requests": template_read_counts(template),
+                "payload_bytes": 0,
+            }
+            template_plan["pairs"] = await asyncio.gather(
+                *[
+                    plan_pair(session, template, value_dataset_id)
+                    for value_dataset_id in value_dataset_ids
+                ]
+            )
+            for pair_plan in template_plan["pairs"]:
+                add_request_counts(template_plan["requests"], pair_plan["requests"])
+                template_plan["payload_bytes"] += pair_plan["payload_bytes"]
+            template_plan["estimate"] = estimate_runtime(template_plan["requests"])
+            add_request_counts(plan_result["requests"], template_plan["requests"])
+            plan_result["payload_bytes"] += template_plan["payload_bytes"]
+            plan_result["templates"].append(template_plan)
+    plan_result["estimate"] = estimate_runtime(plan_result["requests"])
+    return plan_result
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) as f:
+        mapping = json.load(f)
+    mapping = mapping.get("payload", mapping)
+    result = asyncio.run(plan(mapping))
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        # Progress is printed by the shared read path; keep the plan on its own line
+        print(json.dumps(result))
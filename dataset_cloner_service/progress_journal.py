@@ -0,0 +1,60 @@
+import time
+import sqlite3
+
+
+class ProgressJournal:
+    """Append-only record of finished column and hierarchy updates.
+
+    Rows are keyed by message id, dataset pair ("template:destination"), kind
+    ("column" or "hierarchy") and template column id, so a redelivered message
+    can skip whatever an earlier delivery already finished. Rows older than
+    ``retention`` seconds are dropped when the journal is opened.
+    """
+
+    def __init__(self, path, retention):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS progress (
+                message_id TEXT NOT NULL,
+                pair TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                column_id TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (message_id, pair, kind, column_id)
+            )
+            """
+        )
+        self.connection.execute(
+            "DELETE FROM progress WHERE recorded_at < ?", (time.time() - retention,)
+        )
+        self.connection.commit()
+
+    def completed(self, message_ids, pair):
+        """Template column ids any of ``message_ids`` already did for a pair."""
+        message_ids = list(message_ids)
+        done = {"column": set(), "hierarchy": set()}
+        rows = self.connection.execute(
+            "SELECT kind, column_id FROM progress WHERE pair = ? AND message_id IN "
+            f"({', '.join('?' * len(message_ids))})",
+            [pair] + message_ids,
+        )
+        for kind, column_id in rows:
+            done[kind].add(column_id)
+        return done
+
+    def record(self, message_ids, pair, kind, column_id):
+        """Mark an update done for the pair under every one of ``message_ids``."""
+        try:
+            recorded_at = time.time()
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO progress VALUES (?, ?, ?, ?, ?)",
+                [
+                    (message_id, pair, kind, column_id, recorded_at)
+                    for message_id in message_ids
+                ],
+            )
+            self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Progress journal write failed for {pair}, {kind} {column_id}: {e}")
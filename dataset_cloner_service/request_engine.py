@@ -0,0 +1,314 @@
+import time
+import random
+import asyncio
+import aiohttp
+import contextvars
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from config import (
+    LUZMO_KnT_CREDENTIALS,
+    LUZMO_KEY_WINDOW,
+    LUZMO_KEY_BUDGET,
+    LUZMO_KEY_COOLDOWN,
+    luzmo_endpoints,
+    luzmo_rate_limits,
+    luzmo_concurrency_limits,
+    MAX_EXECUTION_TIME,
+    HANDOFF_MARGIN,
+    REQUEST_TIMEOUT,
+    AIMD_MIN_LIMIT,
+    AIMD_DECREASE_FACTOR,
+    AIMD_LATENCY_TOLERANCE,
+    AIMD_LATENCY_SAMPLES,
+    AIMD_REBASELINE_AFTER,
+)
+from aimd import AIMDLimiter
+
+MAX_RETRIES = 5  # Maximum number of retries
+INITIAL_RETRY_DELAY = 2  # Initial delay for retries in seconds
+MAX_RETRY_DELAY = 60  # Upper bound for a single backoff sleep in seconds
+RETRY_STATUSES = [429, 504]  # Too Many Requests, Gateway Timeout
+
+# Monotonic deadline of the current invocation. Tasks inherit it from the
+# coroutine that called start_deadline, so concurrent runs keep their own.
+invocation_deadline = contextvars.ContextVar("invocation_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """A request was not sent, or abandoned, because the invocation is out of time.
+
+    Work that hits it is deferred to the follow-up message rather than counted
+    as failed.
+    """
+
+
+headers = {
+    "Content-Type": "application/json",
+}
+
+
+class CredentialPool:
+    """Hands out Luzmo key/token pairs by remaining rate budget.
+
+    Every key keeps the times of its requests and 429s over the last
+    ``window`` seconds. A request goes to the usable key with the most budget
+    left (fewest recent 429s on a tie); a key that was throttled is out of
+    rotation until its cooldown or Retry-After has passed.
+    """
+
+    def __init__(self, credentials, window, budget, cooldown):
+        self.credentials = list(credentials)
+        self.window = window
+        self.budget = budget
+        self.cooldown = cooldown
+        self.sent = [deque() for _ in self.credentials]
+        self.throttled = [deque() for _ in self.credentials]
+        self.cooling_until = [0.0 for _ in self.credentials]
+
+    def _trim(self, index, now):
+        for timestamps in (self.sent[index], self.throttled[index]):
+            while timestamps and timestamps[0] <= now - self.window:
+                timestamps.popleft()
+
+    def headroom(self, index, now):
+        self._trim(index, now)
+        return self.budget - len(self.sent[index])
+
+    def usable(self, now):
+        return [
+            index
+            for index in range(len(self.credentials))
+            if self.cooling_until[index] <= now
+        ]
+
+    def acquire(self):
+        """Index of the key to use for the next request."""
+        now = time.monotonic()
+        usable = self.usable(now)
+        if usable:
+            index = max(
+                usable,
+                key=lambda i: (self.headroom(i, now), -len(self.throttled[i])),
+            )
+        else:
+            index = min(
+                range(len(self.credentials)), key=lambda i: self.cooling_until[i]
+            )
+        self.sent[index].append(now)
+        return index
+
+    def report_throttled(self, index, retry_after=None):
+        now = time.monotonic()
+        self.throttled[index].append(now)
+        self.cooling_until[index] = max(
+            self.cooling_until[index],
+            now + (self.cooldown if retry_after is None else retry_after),
+        )
+
+
+credential_pool = CredentialPool(
+    LUZMO_KnT_CREDENTIALS, LUZMO_KEY_WINDOW, LUZMO_KEY_BUDGET, LUZMO_KEY_COOLDOWN
+)
+
+
+def start_deadline(seconds=MAX_EXECUTION_TIME):
+    invocation_deadline.set(time.monotonic() + seconds)
+
+
+def time_left():
+    deadline = invocation_deadline.get()
+    if deadline is None:
+        return float("inf")
+    return deadline - time.monotonic()
+
+
+def out_of_time():
+    """True once no new work should be started in this invocation."""
+    return time_left() < HANDOFF_MARGIN
+
+
+class TokenBucket:
+    """Token bucket shared by every request to one endpoint.
+
+    Implemented as reservations on a virtual clock (GCRA), so it needs no lock
+    and is safe to reuse across event loops. ``block_for`` pushes the whole
+    bucket back when the API answers with ``Retry-After``.
+    """
+
+    def __init__(self, rate, burst):
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.tat = 0.0  # theoretical arrival time of the next request
+        self.blocked_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            tat = max(self.tat, now, self.blocked_until)
+            self.tat = tat + self.interval
+            wait = tat - now - self.tolerance
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if time.monotonic() >= self.blocked_until:
+                return
+
+    def block_for(self, seconds):
+        until = time.monotonic() + seconds
+        if until > self.blocked_until:
+            self.blocked_until = until
+            # Spend the burst allowance so traffic resumes at the sustained rate
+            self.tat = max(self.tat, until + self.tolerance)
+
+
+# One bucket per (API key index, endpoint)
+rate_limiters = {
+    (index, endpoint): TokenBucket(limits["rate"], limits["burst"])
+    for index in range(len(LUZMO_KnT_CREDENTIALS))
+    for endpoint, limits in luzmo_rate_limits.items()
+}
+
+
+def build_concurrency_limiter(endpoint, mode):
+    maximum = luzmo_concurrency_limits[endpoint][mode] * len(LUZMO_KnT_CREDENTIALS)
+    return AIMDLimiter(
+        f"{endpoint} {mode}",
+        initial=max(AIMD_MIN_LIMIT, maximum // 2),
+        minimum=AIMD_MIN_LIMIT,
+        maximum=maximum,
+        decrease_factor=AIMD_DECREASE_FACTOR,
+        latency_tolerance=AIMD_LATENCY_TOLERANCE,
+        latency_samples=AIMD_LATENCY_SAMPLES,
+        rebaseline_after=AIMD_REBASELINE_AFTER,
+    )
+
+
+concurrency_limiters = {
+    (endpoint, mode): build_concurrency_limiter(endpoint, mode)
+    for endpoint in luzmo_concurrency_limits
+    for mode in ["read", "write"]
+}
+
+
+def get_concurrency_limiter(endpoint, payload):
+    mode = "read" if payload.get("action") == "get" else "write"
+    return concurrency_limiters[(endpoint, mode)]
+
+
+def concurrency_summary():
+    """Current limit and recent adjustments of every endpoint limiter."""
+    return {
+        f"{endpoint} {mode}": limiter.summary()
+        for (endpoint, mode), limiter in concurrency_limiters.items()
+    }
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    # Full jitter keeps coroutines that failed together from retrying together
+    return random.uniform(0, min(MAX_RETRY_DELAY, INITIAL_RETRY_DELAY * 2**attempt))
+
+
+async def luzmo_request(session, endpoint, payload, description=""):
+    """POST ``payload`` to a Luzmo endpoint through the shared rate limiter.
+
+    Holds a read or write slot of the endpoint while the request is in flight
+    (released during backoff sleeps). Each attempt takes key/token from the
+    credential pool, retries 429/504 and connection errors with jittered
+    backoff (or ``Retry-After`` when present) and returns the decoded JSON, or
+    None once the request has failed for good. Requests must be done
+    HANDOFF_MARGIN seconds before the invocation deadline; a request that
+    cannot be sent, finished or retried by then raises DeadlineExceeded.
+    """
+    url = luzmo_endpoints[endpoint]
+    limiter = get_concurrency_limiter(endpoint, payload)
+
+    for attempt in range(MAX_RETRIES):
+        async with limiter:
+            credential_index = credential_pool.acquire()
+            payload["key"], payload["token"] = credential_pool.credentials[
+                credential_index
+            ]
+            bucket = rate_limiters[(credential_index, endpoint)]
+            await bucket.acquire()
+            remaining = time_left() - HANDOFF_MARGIN
+            if remaining <= 0:
+                raise DeadlineExceeded(f"not sending {endpoint} for {description}")
+            timeout = aiohttp.ClientTimeout(total=min(REQUEST_TIMEOUT, remaining))
+            sent_at = time.monotonic()
+            try:
+                async with session.post(
+                    url, json=payload, headers=headers, timeout=timeout
+                ) as response:
+                    limiter.record(response.status, sent_at)
+                    if response.status in RETRY_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        if response.status == 429:
+                            credential_pool.report_throttled(credential_index, retry_after)
+                        if retry_after is not None:
+                            bucket.block_for(retry_after)
+                        if response.status == 429 and credential_pool.usable(
+                            time.monotonic()
+                        ):
+                            # Another key can take the retry straight away
+                            delay = backoff_delay(0)
+                        elif retry_after is not None:
+                            delay = retry_after + random.uniform(0, INITIAL_RETRY_DELAY)
+                        else:
+                            delay = backoff_delay(attempt)
+                        print(
+                            f"Rate limit exceeded on {endpoint} (key {credential_index}) for {description}, retrying after "
+                            f"{delay:.2f} seconds... Status : {response.status}"
+                        )
+                    else:
+                        try:
+                            response.raise_for_status()
+                            return await response.json()
+                        except aiohttp.ClientResponseError as e:
+                            error_details = await response.text()
+                            print(
+                                f"{endpoint} API call failed for {description} "
+                                f"with status: {response.status}, message: {e.message}, "
+                                f"error details: {error_details}"
+                            )
+                            return None  # No point in retrying for client errors like 400 Bad Request
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    if remaining < REQUEST_TIMEOUT:
+                        # Cut short by the deadline, not slow on the server's side
+                        raise DeadlineExceeded(
+                            f"{endpoint} for {description} still running at the hand-off"
+                        )
+                    limiter.record(504, sent_at)
+                delay = backoff_delay(attempt)
+                print(
+                    f"Connection error occurred on {endpoint} for {description} "
+                    f"on attempt {attempt + 1}/{MAX_RETRIES}: {repr(e)}"
+                )
+            except Exception as e:
+                print(
+                    f"An unexpected error occurred on {endpoint} for {description} "
+                    f"with exception: {str(e)}"
+                )
+                return None
+
+        if attempt == MAX_RETRIES - 1:
+            break
+        if delay >= time_left() - HANDOFF_MARGIN:
+            raise DeadlineExceeded(f"no time left to retry {endpoint} for {description}")
+        await asyncio.sleep(delay)
+
+    print(f"Giving up on {endpoint} for {description} after {attempt + 1} attempts.")
+    return None
@@ -0,0 +1,163 @@
+import os
+import gzip
+import json
+import time
+
+
+class LocalDiskBackend:
+    """Cache entries stored as files in a local directory.
+
+    File access times are bumped on every read so they double as LRU recency.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(self._path(key))
+        return data
+
+    def put(self, key, data):
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """(key, size in bytes, last used timestamp) for every stored entry."""
+        entries = []
+        for key in os.listdir(self.root):
+            if key.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(self._path(key))
+            except FileNotFoundError:
+                continue
+            entries.append((key, stat.st_size, stat.st_mtime))
+        return entries
+
+
+class GCSBackend:
+    """Cache entries stored as objects under a prefix of a GCS bucket.
+
+    Needs google-cloud-storage, which is only imported when this backend is
+    used. Last use is kept in the object's custom metadata.
+    """
+
+    def __init__(self, bucket_name, prefix="template_cache/"):
+        from google.cloud import storage
+
+        self.bucket = storage.Client().bucket(bucket_name)
+        self.prefix = prefix
+
+    def get(self, key):
+        blob = self.bucket.blob(self.prefix + key)
+        try:
+            data = blob.download_as_bytes()
+        except Exception:
+            return None
+        blob.metadata = {"last_used": str(time.time())}
+        blob.patch()
+        return data
+
+    def put(self, key, data):
+        blob = self.bucket.blob(self.prefix + key)
+        blob.metadata = {"last_used": str(time.time())}
+        blob.upload_from_string(data)
+
+    def delete(self, key):
+        try:
+            self.bucket.blob(self.prefix + key).delete()
+        except Exception:
+            pass
+
+    def entries(self):
+        entries = []
+        for blob in self.bucket.client.list_blobs(self.bucket, prefix=self.prefix):
+            last_used = (blob.metadata or {}).get("last_used")
+            entries.append(
+                (
+                    blob.name[len(self.prefix) :],
+                    blob.size,
+                    float(last_used) if last_used else blob.updated.timestamp(),
+                )
+            )
+        return entries
+
+
+class TemplateCache:
+    """Template column and hierarchy metadata keyed by dataset id.
+
+    An entry is only served while the version it was stored with matches the
+    template's current version, and least recently used entries are evicted
+    once the backend holds more than ``max_bytes``. Editing hierarchy values
+    does not change that version, so cached hierarchies are only served for
+    ``hierarchy_max_age`` seconds after they were read.
+    """
+
+    def __init__(self, backend, max_bytes, hierarchy_max_age):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.hierarchy_max_age = hierarchy_max_age
+
+    @staticmethod
+    def _key(dataset_id):
+        return f"{dataset_id}.json.gz"
+
+    def get(self, dataset_id, version):
+        try:
+            data = self.backend.get(self._key(dataset_id))
+            if data is None:
+                return None
+            entry = json.loads(gzip.decompress(data))
+        except Exception as e:
+            print(f"Template cache read failed for {dataset_id}: {e}")
+            return None
+        if entry["version"] != version:
+            print(f"Template cache stale for {dataset_id}: {entry['version']} != {version}")
+            return None
+        if time.time() - entry.get("hierarchies_at", 0) > self.hierarchy_max_age:
+            print(f"Template cache hit for {dataset_id}, hierarchies expired")
+            return entry["columns"], None
+        print(f"Template cache hit for {dataset_id}")
+        return entry["columns"], entry["hierarchies"]
+
+    def put(self, dataset_id, version, columns, hierarchies):
+        entry = {
+            "version": version,
+            "columns": columns,
+            "hierarchies": hierarchies,
+            "hierarchies_at": time.time(),
+        }
+        try:
+            self.backend.put(
+                self._key(dataset_id), gzip.compress(json.dumps(entry).encode("utf-8"))
+            )
+            self.evict()
+        except Exception as e:
+            print(f"Template cache write failed for {dataset_id}: {e}")
+
+    def evict(self):
+        entries = sorted(self.backend.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self.backend.delete(key)
+            total -= size
+            print(f"Template cache evicted {key}")
@@ -0,0 +1,101 @@
+import os
+import sys
+import socket
+import tempfile
+import contextlib
+
+import pytest
+
+# The service modules import each other top-level (from config import ...),
+# and main opens its template cache, progress journal and fingerprint store
+# on import, so point those at a scratch directory first
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(SERVICE_DIR)
+STATE_DIR = tempfile.mkdtemp(prefix="cloner_tests_")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# config reads LUZMO_BASE_URL on import: the luzmo_stub fixture serves there
+STUB_PORT = free_port()
+os.environ["LUZMO_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/0.1.0/"
+os.environ["TEMPLATE_CACHE_DIR"] = os.path.join(STATE_DIR, "template_cache")
+os.environ.pop("TEMPLATE_CACHE_BUCKET", None)
+os.environ["PROGRESS_JOURNAL_PATH"] = os.path.join(STATE_DIR, "progress.sqlite3")
+os.environ["FINGERPRINT_STORE_PATH"] = os.path.join(STATE_DIR, "fingerprints.sqlite3")
+sys.path.insert(0, SERVICE_DIR)
+sys.path.append(REPO_DIR)
+
+
+@pytest.fixture
+def luzmo_stub():
+    """Starts the stand-in Luzmo API inside the test's event loop.
+
+    ``async with luzmo_stub(columns=10) as stub:`` serves a freshly seeded
+    LuzmoStub with those settings for the duration of the block.
+    """
+    from aiohttp import web
+
+    from luzmo_stub.server import build_app
+
+    @contextlib.asynccontextmanager
+    async def serve(**settings):
+        app = build_app(settings)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", STUB_PORT).start()
+        try:
+            yield app["stub"]
+        finally:
+            await runner.cleanup()
+
+    return serve
+
+
+@pytest.fixture
+def cloner(tmp_path, monkeypatch):
+    """main with an empty template cache, progress journal and fingerprint store.
+
+    The per-key rate limits are lifted so runs against the stub are quick, and
+    the AIMD limits start over.
+    """
+    import main
+    import request_engine
+    from fingerprint_store import FingerprintStore
+    from progress_journal import ProgressJournal
+    from template_cache import LocalDiskBackend, TemplateCache
+
+    monkeypatch.setattr(
+        main,
+        "template_cache",
+        TemplateCache(
+            LocalDiskBackend(str(tmp_path / "template_cache")),
+            main.TEMPLATE_CACHE_MAX_BYTES,
+            main.TEMPLATE_CACHE_HIERARCHY_MAX_AGE,
+        ),
+    )
+    monkeypatch.setattr(
+        main,
+        "progress_journal",
+        ProgressJournal(str(tmp_path / "progress.sqlite3"), main.PROGRESS_JOURNAL_RETENTION),
+    )
+    monkeypatch.setattr(
+        main,
+        "fingerprint_store",
+        FingerprintStore(str(tmp_path / "fingerprints.sqlite3"), main.FINGERPRINT_MAX_AGE),
+    )
+    for key in list(request_engine.rate_limiters):
+        monkeypatch.setitem(
+            request_engine.rate_limiters, key, request_engine.TokenBucket(1000, 1000)
+        )
+    for endpoint, mode in list(request_engine.concurrency_limiters):
+        monkeypatch.setitem(
+            request_engine.concurrency_limiters,
+            (endpoint, mode),
+            request_engine.build_concurrency_limiter(endpoint, mode),
+        )
+    return main
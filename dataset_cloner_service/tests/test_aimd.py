@@ -0,0 +1,109 @@
+import time
+import asyncio
+
+import pytest
+
+import aimd
+from aimd import AIMDLimiter
+
+
+def limiter(initial=4, maximum=16):
+    return AIMDLimiter(
+        "test",
+        initial=initial,
+        minimum=1,
+        maximum=maximum,
+        decrease_factor=0.5,
+        latency_tolerance=2.0,
+        latency_samples=50,
+        rebaseline_after=3,
+    )
+
+
+class Clock:
+    """Stands in for the time module in aimd: one second per request."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def strftime(self, format):
+        return time.strftime(format)
+
+
+def test_aimd_caps_requests_in_flight():
+    async def scenario():
+        adaptive = limiter(initial=2)
+        await adaptive.acquire()
+        await adaptive.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(adaptive.acquire(), 0.05)
+        assert adaptive.in_flight == 2 and not adaptive.waiters
+        adaptive.release()
+        await asyncio.wait_for(adaptive.acquire(), 0.05)
+
+    asyncio.run(scenario())
+
+
+def test_aimd_increases_only_while_the_limit_is_in_use(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(aimd, "time", clock)
+    adaptive = limiter(initial=4)
+
+    def healthy(count):
+        for _ in range(count):
+            clock.now += 1
+            adaptive.record(200, clock.now - 0.1)
+
+    healthy(1)
+    assert adaptive.limit == 4
+
+    # About +1 per round of requests at the limit
+    adaptive.in_flight = 4
+    healthy(5)
+    assert int(adaptive.limit) == 5
+    # The in-flight count no longer reaches the raised limit
+    healthy(20)
+    assert int(adaptive.limit) == 6
+    adaptive.in_flight = 16
+    healthy(200)
+    assert adaptive.limit == 16
+
+
+def test_aimd_cuts_once_per_burst_of_errors():
+    adaptive = limiter(initial=8)
+    sent_at = time.monotonic()
+    adaptive.record(429, sent_at)
+    assert adaptive.limit == 4
+    # Sent before the cut: says nothing about the new limit
+    adaptive.record(504, sent_at)
+    assert adaptive.limit == 4
+    for _ in range(5):
+        adaptive.record(429, time.monotonic())
+    assert adaptive.limit == 1
+
+
+def test_aimd_rebaselines_after_a_lasting_slowdown(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(aimd, "time", clock)
+    adaptive = limiter(initial=16)
+    adaptive.in_flight = 16
+
+    def healthy(latency, count):
+        for _ in range(count):
+            clock.now += 1
+            adaptive.record(200, clock.now - latency)
+
+    healthy(0.1, 50)
+    assert adaptive.baseline_p95 == pytest.approx(0.1)
+    # The server gets three times slower for good
+    healthy(0.3, 5000)
+
+    latency_cuts = [
+        change for change in adaptive.history if change["reason"].startswith("p95")
+    ]
+    assert len(latency_cuts) == 3
+    assert adaptive.baseline_p95 == pytest.approx(0.3)
+    assert adaptive.limit == 16
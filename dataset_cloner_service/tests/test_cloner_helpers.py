@@ -0,0 +1,56 @@
+import json
+
+import main
+from main import EXCLUDED_COLUMN_FIELDS, column_diff, hierarchy_chunks
+
+
+def test_column_diff_only_sends_changed_properties():
+    template = {
+        "id": "template-column",
+        "name": {"en": "Revenue"},
+        "format": ",.2f",
+        "color": "#1f77b4",
+        "informative": True,
+        "updated_at": "2024-01-02",
+    }
+    dest = {
+        "id": "dest-column",
+        "name": {"en": "Revenue"},
+        "format": ",.0f",
+        "color": "#1f77b4",
+        "updated_at": "2024-01-01",
+    }
+
+    assert column_diff(template, dest) == {"format": ",.2f", "informative": True}
+    assert column_diff(template, dict(dest, format=",.2f", informative=True)) == {}
+
+
+def test_column_diff_without_destination_sends_everything_copied():
+    template = {field: "x" for field in EXCLUDED_COLUMN_FIELDS}
+    template.update(format=",.2f", color=None)
+
+    assert column_diff(template, None) == {"format": ",.2f", "color": None}
+
+
+def test_hierarchy_chunks_stay_under_the_byte_limit(monkeypatch):
+    monkeypatch.setattr(main, "HIERARCHY_CHUNK_BYTES", 200)
+    values = [
+        {"id": f"value_{i}", "name": {"en": f"Value {i}"}, "order": i}
+        for i in range(40)
+    ]
+
+    chunks = hierarchy_chunks(values)
+
+    assert len(chunks) > 1
+    assert [value for chunk in chunks for value in chunk] == values
+    for chunk in chunks:
+        assert sum(len(json.dumps(value)) for value in chunk) <= 200
+
+
+def test_hierarchy_chunks_oversized_value_goes_alone(monkeypatch):
+    monkeypatch.setattr(main, "HIERARCHY_CHUNK_BYTES", 50)
+    big = {"id": "big", "name": {"en": "x" * 100}}
+    small = {"id": "small"}
+
+    assert hierarchy_chunks([small, big, small]) == [[small], [big], [small]]
+    assert hierarchy_chunks([]) == []
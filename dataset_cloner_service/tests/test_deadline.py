@@ -0,0 +1,112 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+import request_engine
+
+
+@pytest.fixture(autouse=True)
+def short_handoff(monkeypatch):
+    monkeypatch.setattr(request_engine, "HANDOFF_MARGIN", 1)
+
+
+def clone_with_deadline(cloner, luzmo_stub, seconds, **settings):
+    async def scenario():
+        async with luzmo_stub(**settings) as stub:
+            template_id, *destination_ids = [
+                dataset_id
+                for dataset_id, securable in stub.securables.items()
+                if securable["type"] == "dataset"
+            ]
+            request_engine.start_deadline(seconds)
+            async with aiohttp.ClientSession() as session:
+                results = await cloner.clone_mapping(
+                    session, {template_id: destination_ids}
+                )
+            column_ids = stub.securables[template_id]["column_ids"]
+            hierarchy_ids = [
+                column_id for column_id in column_ids if column_id in stub.hierarchies
+            ]
+            return results, column_ids, hierarchy_ids
+
+    return asyncio.run(scenario())
+
+
+def assert_every_column_accounted_for(results, column_ids, hierarchy_ids):
+    for result in results:
+        if result["status"] == "deferred" and not (
+            result["deferred"]["columns"] or result["deferred"]["hierarchies"]
+        ):
+            # Never started: requested again in full
+            continue
+        columns = result["columns"]
+        hierarchies = result["hierarchies"]
+        assert (
+            columns["patched"]
+            + columns["skipped"]
+            + columns["failed"]
+            + len(result["deferred"]["columns"])
+            == len(column_ids)
+        )
+        assert hierarchies["patched"] + hierarchies["failed"] + len(
+            result["deferred"]["hierarchies"]
+        ) == len(hierarchy_ids)
+
+
+def test_work_cut_off_by_the_deadline_is_deferred(cloner, luzmo_stub):
+    results, column_ids, hierarchy_ids = clone_with_deadline(
+        cloner,
+        luzmo_stub,
+        2.5,
+        datasets=3,
+        columns=40,
+        hierarchy_values=5,
+        latency_median=0.2,
+        latency_sigma=0.3,
+        dashboards=0,
+    )
+
+    assert_every_column_accounted_for(results, column_ids, hierarchy_ids)
+    # Nothing fails on this stub: whatever did not get done is deferred
+    assert all(result["status"] == "deferred" for result in results)
+    assert not any(
+        result["columns"]["failed"] or result["hierarchies"]["failed"]
+        for result in results
+    )
+    followup = cloner.followup_message({"client_id": 1, "dash_type": "Sales"}, results)
+    assert followup["resume"] == {
+        f"{result['template']}:{result['destination']}": result["deferred"]
+        for result in results
+    }
+
+
+def test_throttled_run_defers_what_it_cannot_finish(cloner, luzmo_stub):
+    results, column_ids, hierarchy_ids = clone_with_deadline(
+        cloner,
+        luzmo_stub,
+        6,
+        datasets=3,
+        columns=40,
+        hierarchy_values=5,
+        latency_median=0.05,
+        rate_429=0.3,
+        retry_after=1,
+        dashboards=0,
+    )
+
+    assert_every_column_accounted_for(results, column_ids, hierarchy_ids)
+    assert any(result["status"] == "deferred" for result in results)
+
+
+def test_pair_that_never_started_is_requested_in_full(cloner):
+    results = [
+        cloner.deferred_summary("t1", "d1", 0),
+        dict(cloner.pair_summary("t1", "d2"), status="done"),
+    ]
+
+    assert cloner.followup_message({"client_id": 1}, results) == {
+        "client_id": 1,
+        "payload": {"t1": ["d1"]},
+        "resume": {},
+    }
@@ -0,0 +1,57 @@
+import asyncio
+
+import aiohttp
+
+STUB_SETTINGS = dict(
+    datasets=2, columns=10, hierarchy_values=5, latency_median=0.001, dashboards=0
+)
+
+
+def test_unchanged_template_skips_the_pair(cloner, luzmo_stub):
+    async def scenario():
+        async with luzmo_stub(**STUB_SETTINGS) as stub:
+            template_id, destination_id = list(stub.securables)
+            mapping = {template_id: destination_id}
+            async with aiohttp.ClientSession() as session:
+                first = await cloner.clone_mapping(session, mapping)
+                unchanged = await cloner.clone_mapping(session, mapping)
+                edited = stub.securables[template_id]["column_ids"][1]
+                stub.columns[edited]["format"] = "edited"
+                stub.columns[edited]["updated_at"] = "9999-12-31T00:00:00.000Z"
+                changed = await cloner.clone_mapping(session, mapping)
+                return first[0], unchanged[0], changed[0]
+
+    first, unchanged, changed = asyncio.run(scenario())
+
+    assert first["status"] == "done"
+    assert unchanged["status"] == "in_sync"
+    assert unchanged["columns"]["skipped"] == 10
+    # A template edit changes the fingerprint: compared again, one patch
+    assert changed["status"] == "done"
+    assert changed["columns"]["patched"] == 1
+
+
+def test_resumed_run_does_not_mark_the_pair_in_sync(cloner, luzmo_stub):
+    async def scenario():
+        async with luzmo_stub(**STUB_SETTINGS) as stub:
+            template_id, destination_id = list(stub.securables)
+            mapping = {template_id: destination_id}
+            pair = f"{template_id}:{destination_id}"
+            drifted = stub.securables[destination_id]["column_ids"][1]
+            async with aiohttp.ClientSession() as session:
+                await cloner.clone_mapping(session, mapping, None, {pair: ["m1"]})
+                stub.columns[drifted]["format"] = "drifted"
+                cloner.fingerprint_store.forget(pair)
+                # Skips everything through the journal, compares nothing
+                redelivery = await cloner.clone_mapping(
+                    session, mapping, None, {pair: ["m1"]}
+                )
+                new_request = await cloner.clone_mapping(session, mapping)
+                return redelivery[0], new_request[0], stub.columns[drifted]["format"]
+
+    redelivery, new_request, fixed_format = asyncio.run(scenario())
+
+    assert redelivery["columns"]["resumed"] == 10
+    assert new_request["status"] == "done"
+    assert new_request["columns"]["patched"] == 1
+    assert fixed_format != "drifted"
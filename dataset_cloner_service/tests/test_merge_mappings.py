@@ -0,0 +1,56 @@
+from main import merge_mappings, message_error
+
+
+def test_full_and_resume_pairs_mixed():
+    payload, resume = merge_mappings(
+        [
+            {
+                "payload": {"t1": ["d1", "d2"]},
+                "resume": {"t1:d2": {"columns": ["c1"], "hierarchies": []}},
+            },
+            {
+                "payload": {"t1": "d2"},
+                "resume": {"t1:d2": {"columns": ["c1", "c2"], "hierarchies": ["h1"]}},
+            },
+            {"payload": {"t1": ["d1"], "t2": "d3"}},
+        ]
+    )
+
+    assert payload == {"t1": ["d1", "d2"], "t2": ["d3"]}
+    # t1:d1 is requested in full; t1:d2 only ever as a resume
+    assert resume == {"t1:d2": {"columns": ["c1", "c2"], "hierarchies": ["h1"]}}
+
+
+def test_full_request_wins_over_resume():
+    payload, resume = merge_mappings(
+        [
+            {
+                "payload": {"t1": "d1"},
+                "resume": {"t1:d1": {"columns": ["c1"], "hierarchies": []}},
+            },
+            {"payload": {"t1": "d1"}},
+        ]
+    )
+
+    assert payload == {"t1": ["d1"]}
+    assert resume == {}
+
+
+def test_duplicate_destinations_are_merged():
+    payload, resume = merge_mappings(
+        [{"payload": {"t1": ["d1", "d1"]}}, {"payload": {"t1": ["d2", "d1"]}}]
+    )
+
+    assert payload == {"t1": ["d1", "d2"]}
+    assert resume == {}
+
+
+def test_message_error():
+    assert message_error({"payload": {"t1": "d1", "t2": ["d2"]}}) is None
+    resume = {"t1:d1": {"columns": [], "hierarchies": []}}
+    assert message_error({"payload": {"t1": "d1"}, "resume": resume}) is None
+    assert message_error({"payload": "garbage"})
+    assert message_error({"payload": {"t1": 1}})
+    assert message_error({"payload": {"t1": ["d1", None]}})
+    assert message_error({"payload": {"t1": "d1"}, "resume": {"t1:d1": ["c1"]}})
+    assert message_error(["not", "a", "message"])
@@ -0,0 +1,59 @@
+import asyncio
+
+import aiohttp
+
+import planner
+
+RESOURCES = {"securable_url": "securable", "column_url": "column", "hierarchy_url": "hierarchy"}
+
+
+def stub_requests(stats):
+    """Requests the stub served, in the planner's endpoint/mode shape."""
+    return {
+        endpoint: {
+            "read": stats[f"{resource} get"],
+            "write": stats[f"{resource} update"],
+        }
+        for endpoint, resource in RESOURCES.items()
+    }
+
+
+def test_plan_matches_the_run_it_predicts(cloner, luzmo_stub, monkeypatch):
+    monkeypatch.setattr(planner, "fingerprint_store", cloner.fingerprint_store)
+
+    async def scenario():
+        async with luzmo_stub(
+            datasets=3, columns=30, hierarchy_values=20, latency_median=0.001, dashboards=0
+        ) as stub:
+            template_id, *destination_ids = list(stub.securables)
+            mapping = {template_id: destination_ids}
+            dry_run = await planner.plan(mapping)
+            planned_requests = stub_requests(stub.stats)
+            stub.stats.clear()
+            async with aiohttp.ClientSession() as session:
+                results = await cloner.clone_mapping(session, mapping)
+            run_requests = stub_requests(stub.stats)
+            # Cloned since: the next plan has nothing to do
+            second_plan = await planner.plan(mapping)
+            return dry_run, planned_requests, results, run_requests, second_plan
+
+    dry_run, planned_requests, results, run_requests, second_plan = asyncio.run(
+        scenario()
+    )
+
+    # Only reads, and exactly the reads a run makes
+    assert all(counts["write"] == 0 for counts in planned_requests.values())
+    assert {
+        endpoint: counts["read"] for endpoint, counts in dry_run["requests"].items()
+    } == {endpoint: counts["read"] for endpoint, counts in planned_requests.items()}
+    assert dry_run["requests"] == run_requests
+    pair_plans = dry_run["templates"][0]["pairs"]
+    for pair_plan, result in zip(pair_plans, results):
+        assert len(pair_plan["column_updates"]) == result["columns"]["patched"]
+        assert pair_plan["columns_in_sync"] == result["columns"]["skipped"]
+        assert len(pair_plan["hierarchy_updates"]) == result["hierarchies"]["patched"]
+    assert dry_run["payload_bytes"] > 0
+    assert [pair["status"] for pair in second_plan["templates"][0]["pairs"]] == [
+        "in_sync",
+        "in_sync",
+    ]
@@ -0,0 +1,89 @@
+import asyncio
+
+import aiohttp
+
+from main import message_key
+from progress_journal import ProgressJournal
+
+
+class Context:
+    def __init__(self, event_id):
+        self.event_id = event_id
+
+
+def test_journal_is_shared_by_the_messages_of_a_pair(tmp_path):
+    journal = ProgressJournal(str(tmp_path / "progress.sqlite3"), 3600)
+    journal.record(["m1", "m2"], "t1:d1", "column", "c1")
+    journal.record(["m2"], "t1:d1", "hierarchy", "c2")
+
+    assert journal.completed(["m1"], "t1:d1") == {"column": {"c1"}, "hierarchy": set()}
+    assert journal.completed(["m3", "m2"], "t1:d1") == {
+        "column": {"c1"},
+        "hierarchy": {"c2"},
+    }
+    assert journal.completed(["m1"], "t1:d2") == {"column": set(), "hierarchy": set()}
+    # Past retention on the next open
+    reopened = ProgressJournal(str(tmp_path / "progress.sqlite3"), -1)
+    assert reopened.completed(["m1", "m2"], "t1:d1") == {
+        "column": set(),
+        "hierarchy": set(),
+    }
+
+
+def test_message_key_needs_a_delivery_id():
+    message = {"client_id": 1, "dash_type": "Sales", "payload": {"t1": "d1"}}
+
+    assert message_key(message, Context(123)) == "123"
+    assert message_key(dict(message, messageId="456"), "context") == "456"
+    # The same body sent twice is two requests, not a redelivery
+    assert message_key(message, "context") is None
+    assert message_key(message, Context(None)) is None
+
+
+def test_redelivery_resumes_and_a_new_request_does_not(cloner, luzmo_stub):
+    async def scenario():
+        async with luzmo_stub(
+            datasets=2, columns=10, hierarchy_values=5, latency_median=0.001, dashboards=0
+        ) as stub:
+            template_id, destination_id = list(stub.securables)
+            mapping = {template_id: destination_id}
+            pair = f"{template_id}:{destination_id}"
+            drifted = stub.securables[destination_id]["column_ids"][1]
+            async with aiohttp.ClientSession() as session:
+                first = await cloner.clone_mapping(session, mapping, None, {pair: ["m1"]})
+                # The destination is edited, and the pair is no longer known
+                # to be in sync, before the message comes back
+                stub.columns[drifted]["format"] = "drifted"
+                cloner.fingerprint_store.forget(pair)
+                redelivery = await cloner.clone_mapping(
+                    session, mapping, None, {pair: ["m1"]}
+                )
+                drifted_format = stub.columns[drifted]["format"]
+                new_request = await cloner.clone_mapping(session, mapping)
+                return (
+                    first[0],
+                    redelivery[0],
+                    drifted_format,
+                    new_request[0],
+                    stub.columns[drifted]["format"],
+                )
+
+    first, redelivery, drifted_format, new_request, fixed_format = asyncio.run(
+        scenario()
+    )
+
+    assert first["status"] == "done"
+    assert first["columns"]["resumed"] == first["hierarchies"]["resumed"] == 0
+    # Everything was finished by the first delivery and is not done again
+    assert redelivery["columns"] == {
+        "skipped": 0,
+        "patched": 0,
+        "failed": 0,
+        "resumed": 10,
+    }
+    assert redelivery["hierarchies"] == {"patched": 0, "failed": 0, "resumed": 2}
+    assert drifted_format == "drifted"
+    # No delivery id, no journal: the drifted column is compared and patched
+    assert new_request["columns"]["resumed"] == 0
+    assert new_request["columns"]["patched"] == 1
+    assert fixed_format != "drifted"
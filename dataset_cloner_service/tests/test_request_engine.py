@@ -0,0 +1,96 @@
+import time
+import asyncio
+
+import aiohttp
+
+import request_engine
+from request_engine import CredentialPool, TokenBucket
+
+
+def test_token_bucket_allows_burst_then_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=50, burst=5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        for _ in range(5):
+            await bucket.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(scenario())
+    assert burst < 0.05
+    # Five more at 50/s
+    assert 0.08 <= total < 0.5
+
+
+def test_token_bucket_block_for_delays_everyone():
+    async def scenario():
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.block_for(0.1)
+        started = time.monotonic()
+        await asyncio.gather(*[bucket.acquire() for _ in range(3)])
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.1
+
+
+def test_credential_pool_spreads_requests_by_headroom():
+    pool = CredentialPool([("k1", "t1"), ("k2", "t2"), ("k3", "t3")], 60, 100, 30)
+
+    indexes = [pool.acquire() for _ in range(9)]
+
+    assert sorted(indexes) == [0, 0, 0, 1, 1, 1, 2, 2, 2]
+    assert [pool.headroom(index, time.monotonic()) for index in range(3)] == [97] * 3
+
+
+def test_throttled_key_sits_out_its_retry_after():
+    pool = CredentialPool([("k1", "t1"), ("k2", "t2")], 60, 100, 30)
+    pool.report_throttled(0, retry_after=0.05)
+
+    assert [pool.acquire() for _ in range(3)] == [1, 1, 1]
+    time.sleep(0.06)
+    # Back in rotation, with the most headroom
+    assert pool.acquire() == 0
+
+
+def test_all_keys_cooling_uses_the_first_to_recover():
+    pool = CredentialPool([("k1", "t1"), ("k2", "t2")], 60, 100, 30)
+    pool.report_throttled(0)
+    pool.report_throttled(1, retry_after=5)
+
+    assert pool.acquire() == 1
+
+
+def test_clone_uses_every_key(cloner, luzmo_stub, monkeypatch):
+    pool = CredentialPool([("key-a", "token-a"), ("key-b", "token-b")], 60, 600, 30)
+    monkeypatch.setattr(request_engine, "credential_pool", pool)
+    monkeypatch.setattr(request_engine, "INITIAL_RETRY_DELAY", 0.1)
+    for endpoint in request_engine.luzmo_endpoints:
+        monkeypatch.setitem(
+            request_engine.rate_limiters, (1, endpoint), TokenBucket(1000, 1000)
+        )
+
+    async def scenario():
+        async with luzmo_stub(
+            datasets=2,
+            columns=20,
+            hierarchy_values=5,
+            latency_median=0.01,
+            rate_429=0.2,
+            retry_after=0.2,
+            dashboards=0,
+        ) as stub:
+            template_id, destination_id = list(stub.securables)
+            async with aiohttp.ClientSession() as session:
+                results = await cloner.clone_mapping(
+                    session, {template_id: destination_id}
+                )
+            return results, stub.stats
+
+    results, stats = asyncio.run(scenario())
+
+    assert [result["status"] for result in results] == ["done"]
+    sent = [stats["key key-a"], stats["key key-b"]]
+    assert min(sent) > 0.3 * sum(sent)
+    assert sum(len(throttled) for throttled in pool.throttled) == stats["injected 429"]
@@ -0,0 +1,25 @@
+import main
+from template_cache import LocalDiskBackend, TemplateCache
+
+
+def test_template_cache_expires_hierarchies_only(tmp_path):
+    cache = TemplateCache(LocalDiskBackend(str(tmp_path)), 1024 * 1024, 3600)
+    cache.put("t1", "v1", {"c1": {"id": "c1"}}, {"c1": [{"id": None}]})
+
+    assert cache.get("t1", "v1") == ({"c1": {"id": "c1"}}, {"c1": [{"id": None}]})
+    assert cache.get("t1", "v2") is None
+    cache.hierarchy_max_age = 0
+    assert cache.get("t1", "v1") == ({"c1": {"id": "c1"}}, None)
+
+
+def test_unusable_bucket_falls_back_to_local_disk(monkeypatch):
+    def no_client(bucket_name):
+        raise ImportError("No module named 'google.cloud.storage'")
+
+    monkeypatch.setattr(main, "TEMPLATE_CACHE_BUCKET", "template-cache")
+    monkeypatch.setattr(main, "GCSBackend", no_client)
+
+    backend = main.template_cache_backend()
+
+    assert isinstance(backend, LocalDiskBackend)
+    assert backend.root == main.TEMPLATE_CACHE_DIR
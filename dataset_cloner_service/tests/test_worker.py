@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+import main
+import worker
+from worker import FlowController, InMemoryMessage, InMemorySource, run_worker
+
+
+@pytest.fixture
+def clone_calls(monkeypatch):
+    """Replace the cloning itself; records (payload, resume, message_ids)."""
+    calls = []
+
+    async def fake_clone_mapping(session, payload, resume, message_ids):
+        calls.append((payload, resume, message_ids))
+        await asyncio.sleep(0.05)
+        return [
+            main.pair_summary(key_dataset_id, value_dataset_id)
+            for key_dataset_id, value_dataset_ids in payload.items()
+            for value_dataset_id in value_dataset_ids
+        ]
+
+    monkeypatch.setattr(worker, "clone_mapping", fake_clone_mapping)
+    monkeypatch.setattr(worker, "publish_followup", lambda json_data, results: None)
+    return calls
+
+
+def run(source, **kwargs):
+    source.close()
+    asyncio.run(run_worker(source, **kwargs))
+    return [message.state for message in source.messages]
+
+
+def message(payload, **fields):
+    return dict({"client_id": 1, "dash_type": "Sales", "payload": payload}, **fields)
+
+
+def test_valid_messages_are_acked(clone_calls):
+    source = InMemorySource()
+    source.publish(message({"t1": "d1"}))
+    source.publish(message({"t2": ["d2", "d3"]}))
+
+    assert run(source, window=0) == ["acked", "acked"]
+    assert [payload for payload, _, _ in clone_calls] == [
+        {"t1": ["d1"]},
+        {"t2": ["d2", "d3"]},
+    ]
+
+
+def test_failed_batch_is_nacked(monkeypatch, clone_calls):
+    async def failing_clone_mapping(session, payload, resume, message_ids):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(worker, "clone_mapping", failing_clone_mapping)
+    source = InMemorySource()
+    source.publish(message({"t1": "d1"}))
+    source.publish(message({"t2": "d2"}))
+
+    assert run(source, window=0.5) == ["nacked", "nacked"]
+
+
+def test_flow_control_caps_messages_in_flight(monkeypatch, clone_calls):
+    in_flight = 0
+    peak = 0
+
+    async def counting_clone_mapping(session, payload, resume, message_ids):
+        nonlocal in_flight, peak
+        messages = len({i for ids in message_ids.values() for i in ids})
+        in_flight += messages
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= messages
+        return []
+
+    monkeypatch.setattr(worker, "clone_mapping", counting_clone_mapping)
+    source = InMemorySource()
+    for index in range(6):
+        source.publish(message({f"t{index}": f"d{index}"}))
+
+    assert run(source, max_messages=2, window=0) == ["acked"] * 6
+    assert peak == 2
+
+
+def test_flow_control_bytes():
+    async def scenario():
+        flow_controller = FlowController(max_messages=10, max_bytes=100)
+        await flow_controller.acquire(60)
+        # Over the byte cap while something is held
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flow_controller.acquire(60), 0.05)
+        await flow_controller.release(60)
+        # An oversized message still goes through on its own
+        await asyncio.wait_for(flow_controller.acquire(500), 0.05)
+        assert (flow_controller.messages, flow_controller.bytes) == (1, 500)
+
+    asyncio.run(scenario())
+
+
+
+def test_bad_message_is_nacked_without_its_batch(clone_calls):
+    source = InMemorySource()
+    source.publish(message({"t1": "d1"}))
+    source.publish(message("garbage"))
+    source.publish(message({"t1": ["d2"], "t2": "d3"}))
+    source.publish(message({"t3": [1, 2]}))
+    source.publish(message({"t4": "d4"}, resume={"t4:d4": {"columns": "c1"}}))
+    undecodable = InMemoryMessage(b"not json", "99")
+    source.messages.append(undecodable)
+    source.queue.put_nowait(undecodable)
+
+    states = run(source, max_messages=10, window=0.5)
+
+    assert states == ["acked", "nacked", "acked", "nacked", "nacked", "nacked"]
+    assert len(clone_calls) == 1
+    payload, resume, message_ids = clone_calls[0]
+    assert payload == {"t1": ["d1", "d2"], "t2": ["d3"]}
+    assert resume == {}
+    # Progress is journaled under the message that asked for each pair
+    assert message_ids == {"t1:d1": ["1"], "t1:d2": ["3"], "t2:d3": ["3"]}
+
+
+def test_shared_pair_is_journaled_under_every_message(clone_calls):
+    source = InMemorySource()
+    source.publish(message({"t1": "d1"}))
+    source.publish(message({"t1": ["d1", "d2"]}))
+
+    run(source, window=0.5)
+
+    _, _, message_ids = clone_calls[0]
+    assert message_ids == {"t1:d1": ["1", "2"], "t1:d2": ["2"]}
+
+
+def test_window_merges_messages(clone_calls):
+    source = InMemorySource()
+    source.publish(message({"t1": "d1"}))
+    source.publish(message({"t1": "d2"}))
+    source.publish(message({"t2": "d3"}))
+
+    assert run(source, window=0.5) == ["acked"] * 3
+    assert len(clone_calls) == 1
+    assert clone_calls[0][0] == {"t1": ["d1", "d2"], "t2": ["d3"]}
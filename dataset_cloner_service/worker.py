@@ -0,0 +1,290 @@
+import json
+import time
+import signal
+import asyncio
+import aiohttp
+
+from config import (
+    WORKER_SUBSCRIPTION,
+    WORKER_MAX_MESSAGES,
+    WORKER_MAX_BYTES,
+    AGGREGATION_WINDOW,
+)
+from main import (
+    clone_mapping,
+    destination_lists,
+    merge_mappings,
+    message_error,
+    run_summary,
+    publish_followup,
+)
+
+
+class FlowController:
+    """Caps the messages, and their bytes, that the worker holds at once."""
+
+    def __init__(self, max_messages, max_bytes):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.messages = 0
+        self.bytes = 0
+        self.condition = asyncio.Condition()
+
+    def _fits(self, size):
+        if self.messages >= self.max_messages:
+            return False
+        # An oversized message is let through once nothing else is held
+        return self.messages == 0 or self.bytes + size <= self.max_bytes
+
+    async def acquire(self, size):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self._fits(size))
+            self.messages += 1
+            self.bytes += size
+
+    async def release(self, size):
+        async with self.condition:
+            self.messages -= 1
+            self.bytes -= size
+            self.condition.notify_all()
+
+
+class PubSubSource:
+    """Streaming pull from a Pub/Sub subscription.
+
+    Needs google-cloud-pubsub, which is only imported when this source is
+    started. The client gets the same flow control as the worker so it does
+    not lease more messages than can be worked on.
+    """
+
+    def __init__(self, subscription, max_messages, max_bytes):
+        self.subscription = subscription
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+
+    async def start(self):
+        import google.auth
+        from google.cloud import pubsub_v1
+
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.loop = loop
+        _, project_id = google.auth.default()
+        self.subscriber = pubsub_v1.SubscriberClient()
+        subscription_path = self.subscriber.subscription_path(
+            project_id, self.subscription
+        )
+        # The callback runs on a client thread; hand the message to the loop
+        self.pull_future = self.subscriber.subscribe(
+            subscription_path,
+            callback=lambda message: loop.call_soon_threadsafe(
+                self.queue.put_nowait, message
+            ),
+            flow_control=pubsub_v1.types.FlowControl(
+                max_messages=self.max_messages, max_bytes=self.max_bytes
+            ),
+        )
+        print(f"Pulling messages from {subscription_path}")
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.pull_future.cancel()
+        self.subscriber.close()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+
+class InMemoryMessage:
+    def __init__(self, data, message_id):
+        self.data = data
+        self.message_id = message_id
+        self.size = len(data)
+        self.state = None
+
+    def ack(self):
+        self.state = "acked"
+
+    def nack(self):
+        self.state = "nacked"
+
+
+class InMemorySource:
+    """Stands in for Pub/Sub when running the worker locally or in tests.
+
+    Messages are published as dicts and delivered once; ``close`` lets the
+    worker finish once everything published so far has been handled.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.messages = []
+
+    async def start(self):
+        pass
+
+    def publish(self, json_data):
+        message = InMemoryMessage(
+            json.dumps(json_data).encode("utf-8"), str(len(self.messages) + 1)
+        )
+        self.messages.append(message)
+        self.queue.put_nowait(message)
+        return message.message_id
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.queue.put_nowait(None)
+
+
+def requested_by(batch):
+    """Ids of the messages of a batch that asked for each dataset pair.
+
+    Progress is journaled under every one of them, so a redelivered message
+    finds it whichever batch it lands in next.
+    """
+    message_ids = {}
+    for message, json_data in batch:
+        for key_dataset_id, value_dataset_ids in destination_lists(
+            json_data["payload"]
+        ).items():
+            for value_dataset_id in value_dataset_ids:
+                message_ids.setdefault(
+                    f"{key_dataset_id}:{value_dataset_id}", []
+                ).append(str(message.message_id))
+    return message_ids
+
+
+async def handle_batch(session, messages):
+    """Clone the merged mapping of a batch; ack only once its work is done.
+
+    Messages that cannot be parsed or whose payload is not a dataset mapping
+    are nacked on their own; the rest are acked or nacked together. Failures
+    of single templates or pairs are reported in the run summary, not here.
+    """
+    started = time.monotonic()
+    batch = []
+    for message in messages:
+        try:
+            json_data = json.loads(message.data.decode("utf-8"))
+            error = message_error(json_data)
+            if error:
+                raise ValueError(error)
+        except Exception as e:
+            print(f"Cloner message {message.message_id} is malformed, nacking: {e}")
+            message.nack()
+            continue
+        batch.append((message, json_data))
+    if not batch:
+        return
+
+    try:
+        payload, resume = merge_mappings([json_data for _, json_data in batch])
+        if len(batch) == 1:
+            json_data = batch[0][1]
+        else:
+            # Follow-ups of a merged batch carry every message's client/dash type
+            json_data = {
+                "client_id": [data.get("client_id") for _, data in batch],
+                "dash_type": [data.get("dash_type") for _, data in batch],
+            }
+        print(
+            f"Dataset Cloner Started for {len(batch)} messages, client_id: ",
+            json_data["client_id"],
+            " for Dashboard Type: ",
+            json_data["dash_type"],
+            " Merged Dataset Mapping Dictionary:",
+            payload,
+        )
+        results = await clone_mapping(session, payload, resume, requested_by(batch))
+        summary = run_summary(results, time.monotonic() - started)
+        print("Run Summary:", json.dumps(summary))
+        await asyncio.get_running_loop().run_in_executor(
+            None, publish_followup, json_data, results
+        )
+    except Exception as e:
+        print(f"Cloner batch of {len(batch)} messages failed, nacking: {e}")
+        for message, _ in batch:
+            message.nack()
+        return
+    for message, _ in batch:
+        message.ack()
+
+
+async def run_worker(
+    source,
+    max_messages=WORKER_MAX_MESSAGES,
+    max_bytes=WORKER_MAX_BYTES,
+    window=AGGREGATION_WINDOW,
+):
+    """Process messages from ``source`` until it is closed.
+
+    Messages arriving within ``window`` seconds of the first one of a batch
+    are merged into one plan (see merge_mappings), so a template shared by
+    several messages is read once. A batch also closes early when flow control
+    has no room for the next message. Every batch shares one aiohttp session,
+    and through the module globals of main and request_engine the same
+    rate/concurrency limiters, template cache and progress journal, so they
+    stay warm between messages.
+    """
+    flow_controller = FlowController(max_messages, max_bytes)
+    loop = asyncio.get_running_loop()
+    in_flight = set()
+
+    async def process(messages):
+        try:
+            await handle_batch(session, messages)
+        finally:
+            for message in messages:
+                await flow_controller.release(message.size)
+
+    await source.start()
+    async with aiohttp.ClientSession() as session:
+        next_message = None
+        closed = False
+        while not closed:
+            message = next_message or await source.get()
+            next_message = None
+            if message is None:
+                break
+            await flow_controller.acquire(message.size)
+            batch = [message]
+            window_ends = loop.time() + window
+            while loop.time() < window_ends:
+                try:
+                    message = await asyncio.wait_for(
+                        source.get(), window_ends - loop.time()
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if message is None:
+                    closed = True
+                    break
+                try:
+                    await asyncio.wait_for(
+                        flow_controller.acquire(message.size),
+                        max(0, window_ends - loop.time()),
+                    )
+                except asyncio.TimeoutError:
+                    # Start the next batch with it
+                    next_message = message
+                    break
+                batch.append(message)
+            task = asyncio.create_task(process(batch))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        # Finish what was already received before closing the session
+        await asyncio.gather(*in_flight)
+
+
+async def run_pubsub_worker():
+    source = PubSubSource(WORKER_SUBSCRIPTION, WORKER_MAX_MESSAGES, WORKER_MAX_BYTES)
+    loop = asyncio.get_running_loop()
+    for sig in [signal.SIGINT, signal.SIGTERM]:
+        loop.add_signal_handler(sig, source.close)
+    await run_worker(source)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_pubsub_worker())
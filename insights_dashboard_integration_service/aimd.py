@@ -0,0 +1,149 @@
+import time
+import asyncio
+from collections import deque
+
+
+class AIMDLimiter:
+    """Concurrency limit tuned by additive increase / multiplicative decrease.
+
+    Each healthy response while the limit is in use raises it by 1/limit
+    (about +1 per round of requests). A 429/504, or a p95 latency over
+    ``latency_tolerance`` times the baseline (the best p95 seen so far),
+    multiplies it by ``decrease_factor``. Requests sent before the last cut
+    cannot cut again, so one burst of errors counts once. When p95 is still
+    over tolerance after ``rebaseline_after`` latency cuts in a row, the server
+    got slower for reasons of its own and that p95 becomes the new baseline
+    instead of cutting again. Slots are handed directly to waiters,
+    so the limiter is not tied to an event loop and keeps what it learned
+    across invocations.
+    """
+
+    def __init__(
+        self,
+        name,
+        initial,
+        minimum,
+        maximum,
+        decrease_factor,
+        latency_tolerance,
+        latency_samples,
+        rebaseline_after,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.latencies = deque(maxlen=latency_samples)
+        self.baseline_p95 = None
+        self.rebaseline_after = rebaseline_after
+        self.latency_cuts = 0
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self.waiters = deque()
+        self.history = deque(maxlen=50)
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def p95(self):
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def record(self, status, sent_at):
+        """Feed back the outcome of a request sent at ``sent_at`` (monotonic)."""
+        if status in [429, 504]:
+            self._decrease(sent_at, f"status {status}")
+            return
+        self.latencies.append(time.monotonic() - sent_at)
+        if len(self.latencies) == self.latencies.maxlen:
+            p95 = self.p95()
+            if self.baseline_p95 is None or p95 < self.baseline_p95:
+                self.baseline_p95 = p95
+                self.latency_cuts = 0
+            elif p95 <= self.baseline_p95 * self.latency_tolerance:
+                self.latency_cuts = 0
+            elif self.latency_cuts >= self.rebaseline_after:
+                print(
+                    f"Latency baseline for {self.name}: "
+                    f"{self.baseline_p95:.2f}s -> {p95:.2f}s"
+                )
+                self.baseline_p95 = p95
+                self.latency_cuts = 0
+            else:
+                if self._decrease(
+                    sent_at, f"p95 {p95:.2f}s over baseline {self.baseline_p95:.2f}s"
+                ):
+                    self.latency_cuts += 1
+                return
+        if self.in_flight + 1 < int(self.limit) and not self.waiters:
+            return  # Limit not in use, nothing learned about a higher one
+        old_limit = self.limit
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        if int(self.limit) != int(old_limit):
+            self._log(old_limit, "healthy")
+            self._wake()
+
+    def _decrease(self, sent_at, reason):
+        """Cut the limit; False if the request predates the last cut."""
+        if sent_at < self.last_decrease:
+            return False
+        self.last_decrease = time.monotonic()
+        old_limit = self.limit
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        # Latencies from before the cut say nothing about the new limit
+        self.latencies.clear()
+        self._log(old_limit, reason)
+        return True
+
+    def _log(self, old_limit, reason):
+        self.history.append(
+            {
+                "at": time.strftime("%H:%M:%S"),
+                "from": int(old_limit),
+                "to": int(self.limit),
+                "reason": reason,
+            }
+        )
+        print(
+            f"Concurrency limit for {self.name}: "
+            f"{int(old_limit)} -> {int(self.limit)} ({reason})"
+        )
+
+    def summary(self):
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "history": list(self.history),
+        }
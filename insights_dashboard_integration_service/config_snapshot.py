@@ -0,0 +1,54 @@
+import os
+import json
+
+import pandas as pd
+
+
+class ConfigSnapshot:
+    """Copies of config tables keyed by table id and ``modified`` timestamp.
+
+    A snapshot is kept in memory for warm invocations and as a Parquet file
+    (with a JSON sidecar holding the timestamp) in ``root`` for cold starts on
+    the same instance. It is only served while the timestamp it was taken at
+    still matches the table's.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.snapshots = {}
+
+    def _paths(self, table_id):
+        base = os.path.join(self.root, table_id.replace(":", "."))
+        return base + ".parquet", base + ".json"
+
+    def get(self, table_id, modified):
+        if table_id in self.snapshots:
+            snapshot_modified, config_df = self.snapshots[table_id]
+            if snapshot_modified == modified:
+                print(f"Config snapshot hit (memory) for {table_id}")
+                return config_df
+        data_path, meta_path = self._paths(table_id)
+        try:
+            with open(meta_path) as f:
+                if json.load(f)["modified"] != modified:
+                    return None
+            config_df = pd.read_parquet(data_path)
+        except Exception:
+            return None
+        print(f"Config snapshot hit (disk) for {table_id}")
+        self.snapshots[table_id] = (modified, config_df)
+        return config_df
+
+    def put(self, table_id, modified, config_df):
+        self.snapshots[table_id] = (modified, config_df)
+        data_path, meta_path = self._paths(table_id)
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            # Data first: a sidecar never points at a file from another version
+            config_df.to_parquet(data_path + ".tmp", index=False)
+            os.replace(data_path + ".tmp", data_path)
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({"modified": modified}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        except Exception as e:
+            print(f"Config snapshot write failed for {table_id}: {e}")
@@ -13,20 +13,53 @@ firebase_login_api_key = os.getenv("FIREBASE_LOGIN_API_KEY_TEST")
 firebase_insights_login_url = (
     "https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword"
 )
+# Insights bearer tokens are reused until INSIGHTS_TOKEN_EXPIRY_MARGIN seconds
+# before they expire and refreshed in the background from
+# INSIGHTS_TOKEN_REFRESH_AHEAD seconds before
+INSIGHTS_TOKEN_EXPIRY_MARGIN = 120
+INSIGHTS_TOKEN_REFRESH_AHEAD = 600
 
 # Luzmo Credentials & URLs
 LUZMO_API_KEY = os.getenv("LUZMO_API_KEY_TEST")
 LUZMO_TOKEN = os.getenv("LUZMO_TOKEN_TEST")
 LUZMO_BQ_ACCOUNT_ID = os.getenv("LUZMO_BQ_ACCOUNT_ID_TEST")
 
-luzmo_base_url = "https://api.us.cumul.io/0.1.0/"
+# LUZMO_BASE_URL points the service at another API host, e.g. the local
+# stand-in in luzmo_stub/
+luzmo_base_url = os.getenv("LUZMO_BASE_URL", "https://api.us.cumul.io/0.1.0/")
 luzmo_endpoints = {
     "acceleration_url": luzmo_base_url + "acceleration",
     "dataprovider_url": luzmo_base_url + "dataprovider",
     "integration_url": luzmo_base_url + "integration",
     "securable_url": luzmo_base_url + "securable",
+    "collection_url": luzmo_base_url + "collection",
 }
 
+# Run log rows are batched in the background: a batch goes out at
+# LOG_BATCH_SIZE rows or LOG_BATCH_MAX_AGE seconds, on up to LOG_SINK_WORKERS
+# threads; logging waits once LOG_BUFFER_SIZE rows are queued. Set
+# LOG_SINK_FILE to write JSON lines to that file instead of BigQuery.
+LOG_BATCH_SIZE = 100
+LOG_BATCH_MAX_AGE = 5  # seconds
+LOG_BUFFER_SIZE = 1000
+LOG_SINK_WORKERS = 2
+LOG_SINK_FILE = os.getenv("LOG_SINK_FILE")
+
+# Local copy of the config table, reused for as long as the table's last
+# modified time is unchanged; only that metadata is read on each run.
+CONFIG_SNAPSHOT_DIR = os.getenv("CONFIG_SNAPSHOT_DIR", "/tmp/config_snapshot")
+
+# Adaptive concurrency for every aiohttp request, one AIMD limiter per API
+# host: the limit starts at half of HTTP_CONCURRENCY_MAX and backs off on
+# 429/504 or a p95 latency over AIMD_LATENCY_TOLERANCE times the best seen,
+# until AIMD_REBASELINE_AFTER such cuts in a row make that p95 the new normal
+HTTP_CONCURRENCY_MAX = 16
+AIMD_MIN_LIMIT = 1
+AIMD_DECREASE_FACTOR = 0.5
+AIMD_LATENCY_TOLERANCE = 2.0
+AIMD_LATENCY_SAMPLES = 50
+AIMD_REBASELINE_AFTER = 3
+
 # Dashboard Service Resources
 config_table_id = "solutionsdw.insights_config.insights_dashboardService_config"
 logger_table_id = "solutionsdw.insights_config.dash_service_logger"
@@ -1,8 +1,9 @@
+import os
 import requests
 import json
 
 # Define API endpoint
-api_url = "https://api.us.cumul.io/0.1.0/securable"
+api_url = os.getenv("LUZMO_BASE_URL", "https://api.us.cumul.io/0.1.0/") + "securable"
 
 
 
@@ -0,0 +1,88 @@
+import ast
+
+
+class DashboardConfig:
+    """One row of the config table with its list and dict columns parsed."""
+
+    __slots__ = (
+        "dashboard_id",
+        "dashboard_type",
+        "dashboard_name",
+        "dashboard_rank",
+        "dataset_names",
+        "dataset_dict",
+        "mandatory_src",
+        "optional_src",
+    )
+
+    def __init__(self, row):
+        self.dashboard_id = row["dashboard_id"]
+        self.dashboard_type = str(row["dashboard_type"]).strip()
+        self.dashboard_name = str(row["dashboard_name"])
+        self.dashboard_rank = str(row["dashboard_rank"]).strip()
+        self.dataset_names = list(ast.literal_eval(row["dataset_names"]))
+        self.dataset_dict = ast.literal_eval(row["dataset_dict"])
+        self.mandatory_src = ast.literal_eval(row["mandatory_src"])
+        self.optional_src = ast.literal_eval(row["optional_src"])
+
+    def __repr__(self):
+        return f"DashboardConfig({self.dashboard_id}, {self.dashboard_type})"
+
+
+class DashboardIndex:
+    """The config table compiled once into lookups by id, type and dataset.
+
+    Where the table repeats a dashboard id or type, the first row wins, as
+    it did for the ``.loc[...].iloc[0]`` lookups this replaces. ``source`` is
+    the DataFrame the index was built from, so a warm process can tell
+    whether the config has been reloaded since.
+    """
+
+    __slots__ = (
+        "source",
+        "by_id",
+        "by_type",
+        "by_dataset",
+        "no_datasets",
+        "position",
+    )
+
+    def __init__(self, config_df):
+        self.source = config_df
+        self.by_id = {}
+        self.by_type = {}
+        self.by_dataset = {}
+        self.no_datasets = []
+        for row in config_df.to_dict(orient="records"):
+            dashboard = DashboardConfig(row)
+            if dashboard.dashboard_id in self.by_id:
+                continue
+            self.by_id[dashboard.dashboard_id] = dashboard
+            self.by_type.setdefault(dashboard.dashboard_type, dashboard)
+            if not dashboard.dataset_names:
+                self.no_datasets.append(dashboard.dashboard_id)
+            for dataset_name in dashboard.dataset_names:
+                self.by_dataset.setdefault(dataset_name, []).append(
+                    dashboard.dashboard_id
+                )
+        self.position = {dashboard_id: i for i, dashboard_id in enumerate(self.by_id)}
+
+    def __repr__(self):
+        return f"DashboardIndex({len(self.by_id)} dashboards)"
+
+    def matching(self, input_datasets):
+        """Dashboards whose datasets are all in ``input_datasets``, in config order."""
+        candidates = set(self.no_datasets)
+        for dataset_name in input_datasets:
+            candidates.update(self.by_dataset.get(dataset_name, ()))
+        return sorted(
+            (
+                dashboard_id
+                for dashboard_id in candidates
+                if all(
+                    dataset_name in input_datasets
+                    for dataset_name in self.by_id[dashboard_id].dataset_names
+                )
+            ),
+            key=self.position.__getitem__,
+        )
@@ -1,10 +1,11 @@
+import os
 import aiohttp
 import asyncio
 import requests
 import json
 
 # Define API endpoint
-api_url = "https://api.us.cumul.io/0.1.0/securable"
+api_url = os.getenv("LUZMO_BASE_URL", "https://api.us.cumul.io/0.1.0/") + "securable"
 
 
 async def getDatasetJSON(session, key, token, datasetId):
@@ -0,0 +1,158 @@
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BigQuerySink:
+    """Inserts log rows into a BigQuery table, creating it on first use.
+
+    One client and table handle are kept for the life of the process.
+    Needs google-cloud-bigquery, which is only imported on the first write.
+    """
+
+    def __init__(self, table_id):
+        # table_id is "project.dataset.table"; rows go to the client's project
+        _, self.dataset_id, self.table_name = table_id.split(".")
+        self.client = None
+        self.table = None
+        self.lock = threading.Lock()
+
+    def _table(self):
+        with self.lock:
+            if self.table is not None:
+                return self.table
+            from google.cloud import bigquery
+
+            self.client = bigquery.Client()
+            table_ref = f"{self.client.project}.{self.dataset_id}.{self.table_name}"
+            try:
+                self.table = self.client.get_table(table_ref)
+                print(f"Table {self.table.table_id} exists.")
+            except Exception:
+                print("Table not found, creating new table...")
+                schema = [
+                    bigquery.SchemaField("timestamp", "TIMESTAMP", mode="REQUIRED"),
+                    bigquery.SchemaField("success", "BOOLEAN", mode="REQUIRED"),
+                    bigquery.SchemaField("error_message", "STRING", mode="NULLABLE"),
+                    bigquery.SchemaField("stage", "STRING", mode="NULLABLE"),
+                ]
+                self.table = self.client.create_table(
+                    bigquery.Table(table_ref, schema=schema)
+                )
+                print(f"Table created: {self.table}")
+            return self.table
+
+    def write(self, rows):
+        table = self._table()
+        errors = self.client.insert_rows(table, rows)
+        if errors:
+            print(f"Encountered errors while inserting rows: {errors}")
+        else:
+            print(f"Success: {len(rows)} rows inserted into BigQuery")
+
+
+class FileSink:
+    """Appends log rows as JSON lines to a local file; stands in for BigQuery."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def write(self, rows):
+        with self.lock, open(self.path, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
+class LogSink:
+    """Batches log rows in the background and hands them to ``sink``.
+
+    A batch is written once it holds ``batch_size`` rows or its first row is
+    ``max_age`` seconds old. Writes run on a thread pool, at most
+    ``workers`` at a time, so they never block the event loop. ``put`` waits
+    while ``buffer_size`` rows are queued, and ``close`` writes everything
+    still buffered before returning. The sink restarts itself on the next
+    ``put``, so one instance serves every invocation of a warm process.
+    """
+
+    def __init__(self, sink, batch_size, max_age, buffer_size, workers, write_attempts=3):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.buffer_size = buffer_size
+        self.workers = workers
+        self.write_attempts = write_attempts
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="log_sink"
+        )
+        self.queue = None
+        self.task = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            # Queues are bound to the loop that first waits on them
+            self.queue = asyncio.Queue(maxsize=self.buffer_size)
+            self.task = loop.create_task(self._run())
+
+    async def put(self, row):
+        self.start()
+        await self.queue.put(row)
+
+    async def close(self):
+        """Write every buffered row and stop the background task."""
+        if self.task is None or self.task.done():
+            return
+        await self.queue.put(None)
+        await self.task
+
+    def _write(self, rows):
+        for attempt in range(self.write_attempts):
+            try:
+                self.sink.write(rows)
+                return
+            except Exception as e:
+                print(
+                    f"Log write of {len(rows)} rows failed on attempt "
+                    f"{attempt + 1}/{self.write_attempts}: {e}"
+                )
+                time.sleep(2**attempt)
+        print(f"Dropped {len(rows)} log rows after {self.write_attempts} attempts")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        write_slots = asyncio.Semaphore(self.workers)
+        writes = set()
+
+        async def write(rows):
+            try:
+                await loop.run_in_executor(self.executor, self._write, rows)
+            finally:
+                write_slots.release()
+
+        closing = False
+        while not closing:
+            row = await self.queue.get()
+            if row is None:
+                break
+            batch = [row]
+            batch_ends = loop.time() + self.max_age
+            while len(batch) < self.batch_size:
+                try:
+                    row = await asyncio.wait_for(
+                        self.queue.get(), max(0, batch_ends - loop.time())
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    closing = True
+                    break
+                batch.append(row)
+            # Waiting for a free writer is what pushes back on a full buffer
+            await write_slots.acquire()
+            task = loop.create_task(write(batch))
+            writes.add(task)
+            task.add_done_callback(writes.discard)
+        await asyncio.gather(*writes)
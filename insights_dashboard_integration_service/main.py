@@ -1,4 +1,3 @@
-import ast
 import time
 import json
 import base64
@@ -6,7 +5,6 @@ import asyncio
 import aiohttp
 import requests
 import tracemalloc
-import numpy as np
 import google.auth
 import pandas as pd
 import datetime
@@ -14,9 +12,14 @@ from datetime import datetime
 
 from google.cloud import bigquery
 from google.cloud import pubsub_v1
+from aimd import AIMDLimiter
+from token_provider import TokenProvider
+from log_sink import LogSink, BigQuerySink, FileSink
+from config_snapshot import ConfigSnapshot
+from dashboard_index import DashboardIndex
 from creater import createDashboardAPI
 from getDashboardJSON import getDashboardJSON
-from google.api_core.exceptions import GoogleAPIError
+from google.api_core.exceptions import GoogleAPIError, NotFound
 
 tracemalloc.start()
 _, PROJECT_ID = google.auth.default()
@@ -30,13 +33,27 @@ if PROJECT_ID == "insightsprod":
         firebase_insights_login_payload,
         firebase_login_api_key,
         firebase_insights_login_url,
+        INSIGHTS_TOKEN_EXPIRY_MARGIN,
+        INSIGHTS_TOKEN_REFRESH_AHEAD,
         LUZMO_API_KEY,
         LUZMO_TOKEN,
         LUZMO_BQ_ACCOUNT_ID,
         luzmo_endpoints,
         config_table_id,
         logger_table_id,
+        LOG_BATCH_SIZE,
+        LOG_BATCH_MAX_AGE,
+        LOG_BUFFER_SIZE,
+        LOG_SINK_WORKERS,
+        LOG_SINK_FILE,
+        CONFIG_SNAPSHOT_DIR,
         slack_workflow_link,
+        HTTP_CONCURRENCY_MAX,
+        AIMD_MIN_LIMIT,
+        AIMD_DECREASE_FACTOR,
+        AIMD_LATENCY_TOLERANCE,
+        AIMD_LATENCY_SAMPLES,
+        AIMD_REBASELINE_AFTER,
         TOPIC,
     )
 elif PROJECT_ID == "solutionsdw":
@@ -46,49 +63,98 @@ elif PROJECT_ID == "solutionsdw":
         firebase_insights_login_payload,
         firebase_login_api_key,
         firebase_insights_login_url,
+        INSIGHTS_TOKEN_EXPIRY_MARGIN,
+        INSIGHTS_TOKEN_REFRESH_AHEAD,
         LUZMO_API_KEY,
         LUZMO_TOKEN,
         LUZMO_BQ_ACCOUNT_ID,
         luzmo_endpoints,
         config_table_id,
         logger_table_id,
+        LOG_BATCH_SIZE,
+        LOG_BATCH_MAX_AGE,
+        LOG_BUFFER_SIZE,
+        LOG_SINK_WORKERS,
+        LOG_SINK_FILE,
+        CONFIG_SNAPSHOT_DIR,
         slack_workflow_link,
+        HTTP_CONCURRENCY_MAX,
+        AIMD_MIN_LIMIT,
+        AIMD_DECREASE_FACTOR,
+        AIMD_LATENCY_TOLERANCE,
+        AIMD_LATENCY_SAMPLES,
+        AIMD_REBASELINE_AFTER,
     )
 
 
-log_queue = asyncio.Queue()
-# log_queue = []
+log_sink = LogSink(
+    FileSink(LOG_SINK_FILE) if LOG_SINK_FILE else BigQuerySink(logger_table_id),
+    LOG_BATCH_SIZE,
+    LOG_BATCH_MAX_AGE,
+    LOG_BUFFER_SIZE,
+    LOG_SINK_WORKERS,
+)
+config_snapshots = ConfigSnapshot(CONFIG_SNAPSHOT_DIR)
+dashboard_index = None
 logged_asset = None
 
 processed_datasets = {}
 dataset_lock = asyncio.Lock()
 
+# Insights dashboard types of each client for the current run, loaded once and
+# kept in step with our own add_to_insights calls
+insights_dashboard_state = {}
 
-def create_table_if_not_exists(dataset_id, table_id):
-    client = bigquery.Client()
-    dataset_ref = client.dataset(dataset_id)
+http_limiters = {}
 
-    try:
-        table_ref = dataset_ref.table(table_id)
-        table = client.get_table(table_ref)
-        print(f"Table {table.table_id} exists.")
-        return table
-    except Exception as e:
-        print(f"Table not found, creating new table...")
-        schema = [
-            bigquery.SchemaField("timestamp", "TIMESTAMP", mode="REQUIRED"),
-            bigquery.SchemaField("success", "BOOLEAN", mode="REQUIRED"),
-            bigquery.SchemaField("error_message", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("stage", "STRING", mode="NULLABLE"),
-        ]
-        table = bigquery.Table(dataset_ref.table(table_id), schema=schema)
-        table = client.create_table(table)
-        print(f"Table created: {table}")
-        return table
+
+def get_http_limiter(url):
+    if url.host not in http_limiters:
+        http_limiters[url.host] = AIMDLimiter(
+            url.host,
+            initial=max(AIMD_MIN_LIMIT, HTTP_CONCURRENCY_MAX // 2),
+            minimum=AIMD_MIN_LIMIT,
+            maximum=HTTP_CONCURRENCY_MAX,
+            decrease_factor=AIMD_DECREASE_FACTOR,
+            latency_tolerance=AIMD_LATENCY_TOLERANCE,
+            latency_samples=AIMD_LATENCY_SAMPLES,
+            rebaseline_after=AIMD_REBASELINE_AFTER,
+        )
+    return http_limiters[url.host]
+
+
+async def on_request_start(session, trace_config_ctx, params):
+    trace_config_ctx.limiter = get_http_limiter(params.url)
+    await trace_config_ctx.limiter.acquire()
+    trace_config_ctx.sent_at = time.monotonic()
+
+
+async def on_request_end(session, trace_config_ctx, params):
+    trace_config_ctx.limiter.record(params.response.status, trace_config_ctx.sent_at)
+    trace_config_ctx.limiter.release()
+
+
+async def on_request_exception(session, trace_config_ctx, params):
+    if isinstance(params.exception, asyncio.TimeoutError):
+        trace_config_ctx.limiter.record(504, trace_config_ctx.sent_at)
+    trace_config_ctx.limiter.release()
+
+
+def limited_session():
+    """aiohttp session whose requests go through the per-host AIMD limiters."""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return aiohttp.ClientSession(trace_configs=[trace_config])
+
+
+def http_concurrency_summary():
+    return {host: limiter.summary() for host, limiter in http_limiters.items()}
 
 
 async def bq_logger(success, stage, error_message=None):
-    await log_queue.put(
+    await log_sink.put(
         {
             "timestamp": datetime.now().isoformat(),
             "success": success,
@@ -97,28 +163,10 @@ async def bq_logger(success, stage, error_message=None):
         }
     )
 
-    # Check queue size and flush if necessary
-    if log_queue.qsize() >= 100:
-        await flush_logs()
-
 
 async def flush_logs():
-    global log_queue
-    if not log_queue.empty():
-        client = bigquery.Client()
-        dataset_id = logger_table_id.split(".")[1]
-        table_id = logger_table_id.split(".")[2]
-        table_ref = create_table_if_not_exists(dataset_id, table_id)
-
-        logs_to_flush = []
-        while not log_queue.empty() and len(logs_to_flush) < 100:
-            logs_to_flush.append(await log_queue.get())
-
-        errors = client.insert_rows(table_ref, logs_to_flush)
-        if errors:
-            print(f"Encountered errors while inserting rows: {errors}")
-        else:
-            print("Success: Data inserted into BigQuery")
+    # Writes every buffered row, not just one batch
+    await log_sink.close()
 
 
 async def warp_dataset(session, dataset_id):
@@ -284,19 +332,25 @@ async def create_dataset(session, table_id):
         )
 
 
-def get_matching(input_datasets, dashboard_config):
-    matching_dashboards = []
+def load_dashboard_index(config_df):
+    """Compile ``config_df`` into a DashboardIndex, reusing it while unchanged."""
+    global dashboard_index
+    # config_loader hands back the same snapshot DataFrame until the table changes
+    if dashboard_index is None or dashboard_index.source is not config_df:
+        dashboard_index = DashboardIndex(config_df)
+    return dashboard_index
+
 
-    for dashboard_name, dataset_names in dashboard_config.items():
-        if all(dataset_name in input_datasets for dataset_name in dataset_names):
-            matching_dashboards.append(dashboard_name)
+def get_matching(input_datasets, dashboard_index):
+    matching_dashboards = dashboard_index.matching(input_datasets)
 
     # bq_logger(success=True, stage=f"Stage Asset: {logged_asset}, Get Matching Fn")
 
     return matching_dashboards
 
 
-async def get_insights_auth(session):
+async def insights_login(session):
+    """Firebase sign-in; returns (idToken, lifetime in seconds) or None."""
     insights_login_params = {"key": firebase_login_api_key}
     insights_login_headers = {"Content-Type": "application/json"}
 
@@ -318,7 +372,7 @@ async def get_insights_auth(session):
                     success=True,
                     stage=f"Stage Asset: {logged_asset}, Bearer Token: {BEARER_TOKEN}",
                 )
-                return BEARER_TOKEN
+                return BEARER_TOKEN, float(response_json.get("expiresIn", 3600))
             else:
                 print("Bearer token not found in login response")
                 await bq_logger(
@@ -336,6 +390,15 @@ async def get_insights_auth(session):
         )
 
 
+insights_token_provider = TokenProvider(
+    insights_login, INSIGHTS_TOKEN_EXPIRY_MARGIN, INSIGHTS_TOKEN_REFRESH_AHEAD
+)
+
+
+async def get_insights_auth(session):
+    return await insights_token_provider.get(session)
+
+
 async def add_to_insights(
     session,
     insight_name,
@@ -391,6 +454,8 @@ async def add_to_insights(
                         success=True,
                         stage=f"Stage Asset: {logged_asset}, Add2Insights: {log}",
                     )
+                    if str(client_id) in insights_dashboard_state:
+                        insights_dashboard_state[str(client_id)].append(dash_type)
                     return True
                 else:
                     print(f"API call failed with status code {response.status}")
@@ -703,6 +768,20 @@ async def check_insights_dashboards(session, client_id):
             )
 
 
+async def insights_dashboard_types(session, client_id, refresh=False):
+    """Dashboard types of a client from the per-run state.
+
+    Only the first call, or one with ``refresh`` for an explicit consistency
+    check, asks the Insights service. If that request fails the state held so
+    far is returned, or None when there is none.
+    """
+    if refresh or str(client_id) not in insights_dashboard_state:
+        dash_types = await check_insights_dashboards(session, client_id)
+        if dash_types is not None:
+            insights_dashboard_state[str(client_id)] = dash_types
+    return insights_dashboard_state.get(str(client_id))
+
+
 async def get_dash_filters(session, dash_id):
     try:
         json_data = await getDashboardJSON(session, LUZMO_API_KEY, LUZMO_TOKEN, dash_id)
@@ -746,40 +825,32 @@ async def get_dash_filters(session, dash_id):
         return None
 
 
-def bq_table_exists(table_id):
-    client = bigquery.Client(project=table_id.split(".")[0])
-    dataset_ref = client.dataset(table_id.split(".")[1])
-    table_ref = dataset_ref.table(table_id.split(".")[2])
-
-    try:
-        client.get_table(table_ref)
-        # bq_logger(success=True, stage=f"Stage Asset: {logged_asset}, BQ Table Check Fn.: {table_id}")
-        return True
-    except Exception as e:
-        # Table does not exist or other error occurred
-        # bq_logger(success=False, stage=f"Stage Asset: {logged_asset}, BQ Table Check Fn. Error: ", error_message=str(e))
-        return False
-
-
 def config_loader(table_id):
     try:
         client = bigquery.Client(project=table_id.split(".")[0])
         query_string = f"""select * from `{table_id}`"""
 
-        if bq_table_exists(table_id):
-            print(f"Dest. Table {table_id} exists.")
-            assets_df = client.query(query_string).result().to_dataframe()
-            if assets_df.empty:
-                log = str("config table is empty! " + table_id)
-                print(log)
-                # bq_logger(success=False, stage=f"Stage Asset: {logged_asset}, Els. Config Loader Fn.: {log}")
-            else:
-                print("Got Config!", assets_df.head())
-                # bq_logger(success=True, stage=f"Stage Asset: {logged_asset}, Config Loader Fn.: {table_id}")
-                return assets_df
-        else:
+        try:
+            table = client.get_table(table_id)
+        except NotFound:
             print(f"Config Table {table_id} not found.")
             return None
+        print(f"Dest. Table {table_id} exists.")
+        modified = table.modified.isoformat() if table.modified else None
+
+        assets_df = config_snapshots.get(table_id, modified) if modified else None
+        if assets_df is None:
+            assets_df = client.query(query_string).result().to_dataframe()
+            if modified and not assets_df.empty:
+                config_snapshots.put(table_id, modified, assets_df)
+        if assets_df.empty:
+            log = str("config table is empty! " + table_id)
+            print(log)
+            # bq_logger(success=False, stage=f"Stage Asset: {logged_asset}, Els. Config Loader Fn.: {log}")
+        else:
+            print("Got Config!", assets_df.head())
+            # bq_logger(success=True, stage=f"Stage Asset: {logged_asset}, Config Loader Fn.: {table_id}")
+            return assets_df
     except GoogleAPIError as e:
         print(f"An error occurred in config_loader: {e}")
         # bq_logger(success=False, stage=f"Stage Asset: {logged_asset}, Config Loader Fn. Error: ", error_message=str(e))
@@ -791,28 +862,24 @@ async def clone_dash(
     client_id,
     client_name,
     dash_id,
-    dashboard_config,
-    config_df,
+    dashboard_index,
     dataset_dict,
     collection_id,
     publisher,
     topic_path,
 ):
     print(dash_id)
+    dashboard = dashboard_index.by_id[dash_id]
     datasetIdMap = {}
     pub_datasetIdMap = {}
     logged_asset = client_id + "_" + dash_id
-    parallel_instance_dash_assoc_check = await check_insights_dashboards(
+    parallel_instance_dash_assoc_check = await insights_dashboard_types(
         session, client_id
     )
     if dash_id not in parallel_instance_dash_assoc_check:
-        for dataset_name in dashboard_config[dash_id]:
+        for dataset_name in dashboard.dataset_names:
             print(dataset_name)
-            old_dataset_id = ast.literal_eval(
-                config_df.loc[
-                    config_df["dashboard_id"] == dash_id, "dataset_dict"
-                ].iloc[0]
-            )[dataset_name]
+            old_dataset_id = dashboard.dataset_dict[dataset_name]
             new_dataset_id = dataset_dict[dataset_name]
             datasetIdMap[old_dataset_id] = new_dataset_id
             async with (
@@ -827,11 +894,9 @@ async def clone_dash(
             "Unique Dataset Mapping Dictionary for Dataset Cloner: ", pub_datasetIdMap
         )
 
-        dash_meta = config_df.loc[config_df["dashboard_id"] == dash_id]
-
         pubsub_message = {
             "client_id": client_id,
-            "dash_type": dash_meta["dashboard_type"].iloc[0].strip(),
+            "dash_type": dashboard.dashboard_type,
             "payload": pub_datasetIdMap,
         }
 
@@ -865,11 +930,7 @@ async def clone_dash(
             datasetkey=LUZMO_API_KEY,
             datasettoken=LUZMO_TOKEN,
             datasetIdMap=datasetIdMap,
-            dashboardName=str(
-                config_df.loc[
-                    config_df["dashboard_id"] == dash_id, "dashboard_name"
-                ].iloc[0]
-            )
+            dashboardName=dashboard.dashboard_name
             + "_"
             + client_name
             + "_"
@@ -879,21 +940,20 @@ async def clone_dash(
         # await associate_integration(session, integration_id, securable_id=new_dash_id)
         await associate_collection(session, collection_id, securable_id=new_dash_id)
         new_dash_filters = await get_dash_filters(session, new_dash_id)
-        dash_meta = config_df.loc[config_df["dashboard_id"] == dash_id]
-        parallel_instance_dash_assoc_check_fin = await check_insights_dashboards(
+        parallel_instance_dash_assoc_check_fin = await insights_dashboard_types(
             session, client_id
         )
         if dash_id not in parallel_instance_dash_assoc_check_fin:
             await add_to_insights(
                 session,
-                insight_name=dash_meta["dashboard_name"].iloc[0],
-                rank=str(dash_meta["dashboard_rank"].iloc[0]).strip(),
-                dash_type=dash_meta["dashboard_type"].iloc[0].strip(),
+                insight_name=dashboard.dashboard_name,
+                rank=dashboard.dashboard_rank,
+                dash_type=dashboard.dashboard_type,
                 client_id=str(client_id),
                 dash_id=new_dash_id,
                 int_id=collection_id,
-                ds_man=ast.literal_eval(dash_meta["mandatory_src"].iloc[0]),
-                ds_opt=ast.literal_eval(dash_meta["optional_src"].iloc[0]),
+                ds_man=dashboard.mandatory_src,
+                ds_opt=dashboard.optional_src,
                 dash_filters=new_dash_filters,
             )
 
@@ -935,7 +995,7 @@ async def slack_alert(session, message_json):
 
 
 async def parallel_tasks(task_info, function_to_call):
-    async with aiohttp.ClientSession() as session:
+    async with limited_session() as session:
         tasks = [function_to_call(session, *task_item) for task_item in task_info]
         results = await asyncio.gather(*tasks)
         return results
@@ -947,6 +1007,7 @@ async def main(event, context):
     #          event (dict): Event payload.
     #          context (google.cloud.functions.Context): Metadata for the event.
     #     """
+    insights_dashboard_state.clear()
     try:
         if PROJECT_ID:
             print("Starting Function in Cloud Mode, with Project ID: ", PROJECT_ID)
@@ -971,17 +1032,8 @@ async def main(event, context):
 
             dataset_dict = {}
 
-            dashboard_config = {
-                key: ast.literal_eval(value)
-                for key, value in config_df[["dashboard_id", "dataset_names"]]
-                .set_index("dashboard_id")
-                .to_dict(orient="dict")["dataset_names"]
-                .items()
-            }
-
-            configTables_arrays = [eval(item) for item in config_df["dataset_names"]]
-            combined_configTables_array = np.concatenate(configTables_arrays)
-            unique_configTable_names = np.unique(combined_configTables_array)
+            dashboard_index = load_dashboard_index(config_df)
+            unique_configTable_names = dashboard_index.by_dataset
 
             eligible_tables_array = [
                 item
@@ -1001,22 +1053,20 @@ async def main(event, context):
             print("Dataset Dictionary:", dataset_dict)
 
             possible_dashboards = get_matching(
-                input_datasets=dataset_dict, dashboard_config=dashboard_config
+                input_datasets=dataset_dict, dashboard_index=dashboard_index
             )
             print("PSBL: ", possible_dashboards)
             existing_dash_types = None
-            async with aiohttp.ClientSession() as session:
-                existing_dash_types = await check_insights_dashboards(
+            async with limited_session() as session:
+                existing_dash_types = await insights_dashboard_types(
                     session, client_id
                 )
             exclusion_list_dash_id = []
 
             for t in existing_dash_types:
-                if config_df["dashboard_type"].isin([t]).any():
+                if t in dashboard_index.by_type:
                     exclusion_list_dash_id.append(
-                        config_df.loc[
-                            config_df["dashboard_type"] == t, "dashboard_id"
-                        ].iloc[0]
+                        dashboard_index.by_type[t].dashboard_id
                     )
             # comment the below line after use (excluding Inventory Amazon)
             # exclusion_list_dash_id.append("e5110000-e62a-4a9d-8e0c-43c7cd887a2d")
@@ -1027,10 +1077,7 @@ async def main(event, context):
             ]
 
             eligible_dash_types = [
-                config_df.loc[config_df["dashboard_id"] == did, "dashboard_type"].iloc[
-                    0
-                ]
-                for did in dash_ids
+                dashboard_index.by_id[did].dashboard_type for did in dash_ids
             ]
             print(
                 "Eligible Dashboard IDs: ",
@@ -1072,8 +1119,7 @@ async def main(event, context):
                     client_id,
                     client_name,
                     dash_id,
-                    dashboard_config,
-                    config_df,
+                    dashboard_index,
                     dataset_dict,
                     collection_id,
                     publisher,
@@ -1084,8 +1130,10 @@ async def main(event, context):
             print("Clone Jobs:", clone_jobs)
             cloner_results = await parallel_tasks(clone_jobs, clone_dash)
 
-        async with aiohttp.ClientSession() as session:
-            final_dash_types_assoc = await check_insights_dashboards(session, client_id)
+        async with limited_session() as session:
+            final_dash_types_assoc = await insights_dashboard_types(
+                session, client_id, refresh=True
+            )
             slack_alert_json = {
                 "client_id": str(client_id),
                 "table_list": str(input_json["table_names"]),
@@ -1094,13 +1142,15 @@ async def main(event, context):
                 "integration_id": str(collection_id),
                 "associated_dash_types": str(final_dash_types_assoc),
                 "associated_dash_count": str(len(final_dash_types_assoc)),
+                "concurrency_limits": json.dumps(http_concurrency_summary()),
             }
 
             await slack_alert(session, slack_alert_json)
-        await flush_logs()
 
     except Exception as e:
         print("An error occurred in main :", str(e))
+    finally:
+        await flush_logs()
 
 
 def hello_pubsub(event, context):
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Appended rather than prepended: the tests here only import modules this
+# service alone has, while dataset_cloner_service has its own main/config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
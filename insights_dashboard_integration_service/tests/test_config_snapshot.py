@@ -0,0 +1,52 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from config_snapshot import ConfigSnapshot
+
+TABLE_ID = "project.insights_config.dashboard_config"
+
+
+def config_frame():
+    return pd.DataFrame(
+        {
+            "dashboard_id": ["d1", "d2"],
+            "dashboard_type": ["Sales", "Inventory"],
+            "dataset_names": ["['orders']", "['stock']"],
+        }
+    )
+
+
+def test_snapshot_is_served_while_the_table_is_unmodified(tmp_path):
+    snapshots = ConfigSnapshot(str(tmp_path))
+    snapshots.put(TABLE_ID, "2024-01-01T00:00:00", config_frame())
+
+    pd.testing.assert_frame_equal(
+        snapshots.get(TABLE_ID, "2024-01-01T00:00:00"), config_frame()
+    )
+    assert snapshots.get(TABLE_ID, "2024-01-02T00:00:00") is None
+    assert snapshots.get("project.insights_config.other", "2024-01-01T00:00:00") is None
+
+
+def test_cold_start_reads_the_snapshot_from_disk(tmp_path):
+    ConfigSnapshot(str(tmp_path)).put(TABLE_ID, "2024-01-01T00:00:00", config_frame())
+
+    # A new instance has nothing in memory
+    cold = ConfigSnapshot(str(tmp_path))
+    pd.testing.assert_frame_equal(
+        cold.get(TABLE_ID, "2024-01-01T00:00:00"), config_frame()
+    )
+    assert ConfigSnapshot(str(tmp_path)).get(TABLE_ID, "2024-01-02T00:00:00") is None
+
+
+def test_unwritable_root_still_serves_from_memory(tmp_path):
+    root = tmp_path / "not_a_directory"
+    root.write_text("")
+    snapshots = ConfigSnapshot(str(root))
+    snapshots.put(TABLE_ID, "2024-01-01T00:00:00", config_frame())
+
+    pd.testing.assert_frame_equal(
+        snapshots.get(TABLE_ID, "2024-01-01T00:00:00"), config_frame()
+    )
+    assert ConfigSnapshot(str(root)).get(TABLE_ID, "2024-01-01T00:00:00") is None
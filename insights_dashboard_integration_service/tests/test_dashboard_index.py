@@ -0,0 +1,88 @@
+import ast
+import random
+
+from dashboard_index import DashboardIndex
+
+
+class ConfigFrame:
+    """Just enough of the config DataFrame for DashboardIndex."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def to_dict(self, orient):
+        assert orient == "records"
+        return [dict(row) for row in self.rows]
+
+
+def config_row(dashboard_id, dashboard_type, dataset_names):
+    return {
+        "dashboard_id": dashboard_id,
+        "dashboard_type": dashboard_type,
+        "dashboard_name": f"Dashboard {dashboard_id}",
+        "dashboard_rank": 1,
+        "dataset_names": repr(dataset_names),
+        "dataset_dict": repr(
+            {name: f"{dashboard_id}-{name}" for name in dataset_names}
+        ),
+        "mandatory_src": repr(dataset_names[:1]),
+        "optional_src": "[]",
+    }
+
+
+def old_get_matching(input_datasets, dashboard_config):
+    matching_dashboards = []
+    for dashboard_name, dataset_names in dashboard_config.items():
+        if all(dataset_name in input_datasets for dataset_name in dataset_names):
+            matching_dashboards.append(dashboard_name)
+    return matching_dashboards
+
+
+def test_matching_agrees_with_the_dataframe_scan():
+    rng = random.Random(7)
+    tables = [f"table_{i}" for i in range(30)]
+    for _ in range(50):
+        rows = [
+            config_row(
+                f"dash_{i}",
+                f"type_{rng.randint(0, 5)}",
+                rng.sample(tables, rng.randint(0, 4)),
+            )
+            for i in range(rng.randint(1, 25))
+        ]
+        index = DashboardIndex(ConfigFrame(rows))
+        dashboard_config = {
+            row["dashboard_id"]: ast.literal_eval(row["dataset_names"]) for row in rows
+        }
+        for _ in range(40):
+            input_datasets = {
+                name: f"new-{name}" for name in rng.sample(tables, rng.randint(0, 15))
+            }
+            assert index.matching(input_datasets) == old_get_matching(
+                input_datasets, dashboard_config
+            )
+
+
+def test_lookups():
+    rows = [
+        config_row("d1", " Sales ", ["orders", "returns"]),
+        config_row("d2", "Inventory", ["stock"]),
+        config_row("d3", "Sales", ["orders"]),
+        config_row("d1", "Duplicate", ["ignored"]),
+    ]
+    index = DashboardIndex(ConfigFrame(rows))
+
+    dashboard = index.by_id["d1"]
+    assert dashboard.dashboard_type == "Sales"
+    assert dashboard.dataset_names == ["orders", "returns"]
+    assert dashboard.dataset_dict == {"orders": "d1-orders", "returns": "d1-returns"}
+    assert dashboard.mandatory_src == ["orders"]
+    assert dashboard.dashboard_rank == "1"
+    # First row wins for a repeated id or type, as .iloc[0] did
+    assert index.by_type["Sales"].dashboard_id == "d1"
+    assert index.by_dataset == {
+        "orders": ["d1", "d3"],
+        "returns": ["d1"],
+        "stock": ["d2"],
+    }
+    assert index.matching({"orders": "x", "stock": "y"}) == ["d2", "d3"]
@@ -0,0 +1,91 @@
+import json
+import time
+import asyncio
+
+from log_sink import FileSink, LogSink
+
+
+def rows_in(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def new_sink(path, max_age=60):
+    return LogSink(
+        FileSink(str(path)), batch_size=10, max_age=max_age, buffer_size=20, workers=2
+    )
+
+
+async def put_rows(sink, first, count):
+    for index in range(first, first + count):
+        await sink.put({"index": index, "success": True})
+
+
+def test_close_writes_every_buffered_row(tmp_path):
+    path = tmp_path / "logs.jsonl"
+    sink = new_sink(path)
+
+    async def invocation():
+        # More rows than the buffer holds, ending on a partial batch that
+        # only close writes (max_age is far away)
+        await put_rows(sink, 0, 357)
+        await sink.close()
+
+    asyncio.run(invocation())
+
+    assert sorted(row["index"] for row in rows_in(path)) == list(range(357))
+
+
+def test_sink_restarts_for_the_next_event_loop(tmp_path):
+    path = tmp_path / "logs.jsonl"
+    sink = new_sink(path)
+
+    async def invocation(first, count):
+        await put_rows(sink, first, count)
+        await sink.close()
+
+    # Warm instance: every invocation runs its own event loop
+    asyncio.run(invocation(0, 357))
+    asyncio.run(invocation(357, 5))
+
+    assert sorted(row["index"] for row in rows_in(path)) == list(range(362))
+
+
+def test_partial_batch_is_written_after_max_age(tmp_path):
+    path = tmp_path / "logs.jsonl"
+    sink = new_sink(path, max_age=0.05)
+
+    async def invocation():
+        await put_rows(sink, 0, 3)
+        await asyncio.sleep(0.3)
+        written = len(rows_in(path))
+        await sink.close()
+        return written
+
+    assert asyncio.run(invocation()) == 3
+
+
+class FlakySink:
+    def __init__(self, path, failures):
+        self.file_sink = FileSink(path)
+        self.failures = failures
+
+    def write(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("insert failed")
+        self.file_sink.write(rows)
+
+
+def test_failed_write_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    path = tmp_path / "logs.jsonl"
+    sink = LogSink(FlakySink(str(path), failures=2), 10, 60, 20, 1)
+
+    async def invocation():
+        await put_rows(sink, 0, 25)
+        await sink.close()
+
+    asyncio.run(invocation())
+
+    assert sorted(row["index"] for row in rows_in(path)) == list(range(25))
@@ -0,0 +1,55 @@
+import asyncio
+
+from token_provider import TokenProvider
+
+
+class Session:
+    def __init__(self, closed=False):
+        self.closed = closed
+
+
+def test_concurrent_callers_share_one_login():
+    logins = []
+
+    async def login(session):
+        logins.append(session)
+        await asyncio.sleep(0.01)
+        return "token", 3600
+
+    async def scenario():
+        provider = TokenProvider(login, expiry_margin=120, refresh_ahead=600)
+        session = Session()
+        return await asyncio.gather(*[provider.get(session) for _ in range(50)])
+
+    assert asyncio.run(scenario()) == ["token"] * 50
+    assert len(logins) == 1
+
+
+def test_failed_background_refresh_is_not_retried():
+    logins = []
+
+    async def login(session):
+        logins.append(session)
+        if session.closed:
+            raise RuntimeError("Session is closed")
+        return f"token{len(logins)}", 1.0
+
+    async def scenario():
+        # Every token is inside the refresh-ahead window straight away
+        provider = TokenProvider(login, expiry_margin=0.2, refresh_ahead=0.9)
+        assert await provider.get(Session()) == "token1"
+        closing = Session()
+        for _ in range(20):
+            assert await provider.get(closing) == "token1"
+            # The caller's session is closed before the refresh gets to run
+            closing.closed = True
+            await asyncio.sleep(0.01)
+            closing.closed = False
+        background_logins = len(logins) - 1
+        # Close to expiry the next caller waits for a login on its session
+        await asyncio.sleep(0.7)
+        return background_logins, await provider.get(Session())
+
+    background_logins, token = asyncio.run(scenario())
+    assert background_logins == 1
+    assert token == "token3"
@@ -0,0 +1,69 @@
+import time
+import asyncio
+
+
+class TokenProvider:
+    """Bearer token cached until shortly before it expires.
+
+    ``login(session)`` performs the actual sign-in and returns
+    ``(token, lifetime in seconds)`` or None. Concurrent callers share one
+    in-flight login. Once a cached token is within ``refresh_ahead`` seconds of
+    expiring, a refresh starts in the background while callers keep getting
+    the cached token; it is no longer handed out ``expiry_margin`` seconds
+    before it expires. The background refresh runs on the caller's session,
+    which may be closed before it finishes; after a failed one the token is
+    only renewed once it is that close to expiring, by a caller that waits
+    for the login. The cache outlives the event loop, so warm invocations
+    reuse the token as well.
+    """
+
+    def __init__(self, login, expiry_margin, refresh_ahead):
+        self.login = login
+        self.expiry_margin = expiry_margin
+        self.refresh_ahead = refresh_ahead
+        self.token = None
+        self.expires_at = 0.0
+        self.pending = None
+        self.refresh_failed = False
+
+    def _valid(self, now):
+        return self.token is not None and now < self.expires_at - self.expiry_margin
+
+    async def _login(self, session, background=False):
+        try:
+            result = await self.login(session)
+        except Exception as e:
+            print(f"Token login failed: {e}")
+            result = None
+        if result:
+            token, lifetime = result
+            self.token = token
+            self.expires_at = time.monotonic() + lifetime
+            self.refresh_failed = False
+        elif background:
+            self.refresh_failed = True
+        return self.token if self._valid(time.monotonic()) else None
+
+    def _start_login(self, session, background=False):
+        loop = asyncio.get_running_loop()
+        # A login started under an earlier event loop cannot be awaited here
+        if (
+            self.pending is None
+            or self.pending.done()
+            or self.pending.get_loop() is not loop
+        ):
+            self.pending = loop.create_task(self._login(session, background))
+        return self.pending
+
+    async def get(self, session):
+        now = time.monotonic()
+        if self._valid(now):
+            if (
+                now >= self.expires_at - self.refresh_ahead
+                and not self.refresh_failed
+                and not session.closed
+            ):
+                self._start_login(session, background=True)
+            return self.token
+        # Shielded so one cancelled caller does not cancel everyone's login
+        return await asyncio.shield(self._start_login(session))
@@ -0,0 +1,334 @@
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+from aiohttp import web
+
+# Local stand-in for the Luzmo API (https://api.us.cumul.io/0.1.0/) covering
+# the securable, column, hierarchy, dataprovider, acceleration and collection
+# resources used by the dataset cloner and the dashboard integration service.
+#
+# Usage: python luzmo_stub/server.py --port 8080 --datasets 24 --columns 300
+# then point a service at it with LUZMO_BASE_URL=http://127.0.0.1:8080/0.1.0/
+#
+# GET /_stub/datasets lists the seeded dataset and dashboard ids,
+# GET /_stub/stats the requests served and errors injected so far.
+
+DEFAULT_SETTINGS = {
+    "seed": 42,
+    # Lognormal response latency in seconds, capped at latency_max
+    "latency_median": 0.05,
+    "latency_sigma": 0.5,
+    "latency_max": 5.0,
+    # Share of requests answered 429 (with Retry-After) or 504 instead
+    "rate_429": 0.0,
+    "rate_504": 0.0,
+    "retry_after": 1,
+    # Seeded data
+    "datasets": 24,
+    "columns": 200,
+    "hierarchy_every": 5,  # every n-th column is a hierarchy column
+    "hierarchy_values": 500,
+    "dashboards": 8,
+}
+
+COLUMN_FORMATS = [",.0f", ",.2f", ".0%", ".2%", "%Y-%m-%d"]
+COLUMN_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", None]
+
+
+def seeded_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+class LuzmoStub:
+    """In-memory securables, columns and hierarchies behind the fake API.
+
+    Every dataset has the same column names, so any two datasets form a
+    template/destination pair; formats, colours and hierarchy values are
+    drawn per dataset so that cloning has real differences to write.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.rng = random.Random(settings["seed"])
+        self.securables = {}
+        self.columns = {}
+        self.hierarchies = {}
+        self.stats = Counter()
+        self.latencies = []
+        for _ in range(settings["datasets"]):
+            self.add_dataset(f"seeded.table_{len(self.securables)}")
+        dataset_ids = list(self.securables)
+        for index in range(settings["dashboards"] if dataset_ids else 0):
+            dashboard_id = seeded_id(self.rng)
+            self.securables[dashboard_id] = {
+                "id": dashboard_id,
+                "type": "dashboard",
+                "name": {"en": f"Dashboard {index}"},
+                "dataset_ids": self.rng.sample(
+                    dataset_ids, min(len(dataset_ids), self.rng.randint(1, 3))
+                ),
+                "contents": {"views": []},
+                "css": "",
+                "updated_at": self.now(),
+            }
+
+    @staticmethod
+    def now():
+        return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def add_dataset(self, source_sheet):
+        dataset_id = seeded_id(self.rng)
+        column_ids = []
+        for index in range(self.settings["columns"]):
+            column_id = seeded_id(self.rng)
+            is_hierarchy = index % self.settings["hierarchy_every"] == 0
+            self.columns[column_id] = {
+                "id": column_id,
+                "securable_id": dataset_id,
+                "name": {"en": f"column_{index}"},
+                "source_name": f"column_{index}",
+                "type": "hierarchy" if is_hierarchy else "numeric",
+                "format": self.rng.choice(COLUMN_FORMATS),
+                "color": self.rng.choice(COLUMN_COLORS),
+                "informative": self.rng.random() < 0.5,
+                "cardinality": self.rng.randint(1, 10000),
+                "updated_at": self.now(),
+            }
+            if is_hierarchy:
+                self.hierarchies[column_id] = [
+                    {
+                        "id": f"value_{value}",
+                        "name": {"en": f"Value {value}"},
+                        "color": self.rng.choice(COLUMN_COLORS),
+                        "order": self.rng.randint(0, 1000),
+                    }
+                    for value in range(self.settings["hierarchy_values"])
+                ]
+            column_ids.append(column_id)
+        self.securables[dataset_id] = {
+            "id": dataset_id,
+            "type": "dataset",
+            "name": {"en": source_sheet},
+            "source_sheet": source_sheet,
+            "column_ids": column_ids,
+            "updated_at": self.now(),
+        }
+        return dataset_id
+
+    # Request handling
+
+    async def handle(self, request):
+        resource = request.match_info["resource"]
+        body = await request.json()
+        action = body.get("action")
+        self.stats[f"{resource} {action}"] += 1
+        self.stats[f"key {body.get('key')}"] += 1
+
+        settings = self.settings
+        latency = min(
+            settings["latency_max"],
+            settings["latency_median"]
+            * math.exp(self.rng.gauss(0, settings["latency_sigma"])),
+        )
+        roll = self.rng.random()
+        if roll < settings["rate_429"]:
+            self.stats["injected 429"] += 1
+            return web.json_response(
+                {"message": "Too Many Requests"},
+                status=429,
+                headers={"Retry-After": str(settings["retry_after"])},
+            )
+        await asyncio.sleep(latency)
+        self.latencies.append(latency)
+        if roll < settings["rate_429"] + settings["rate_504"]:
+            self.stats["injected 504"] += 1
+            return web.json_response({"message": "Gateway Timeout"}, status=504)
+
+        handler = getattr(self, f"{resource}_{action}", None)
+        if handler is None:
+            return web.json_response(
+                {"message": f"Unsupported action {action} on {resource}"}, status=400
+            )
+        try:
+            return web.json_response(handler(body))
+        except KeyError as e:
+            return web.json_response({"message": f"Not found: {e}"}, status=404)
+
+    def column_row(self, column_id):
+        return dict(self.columns[column_id])
+
+    def dataset_row(self, securable, include_columns):
+        row = {
+            key: value for key, value in securable.items() if key != "column_ids"
+        }
+        if include_columns:
+            row["columns"] = [
+                self.column_row(column_id) for column_id in securable["column_ids"]
+            ]
+            # A dataset changes whenever one of its columns does
+            row["updated_at"] = max(
+                [securable["updated_at"]]
+                + [column["updated_at"] for column in row["columns"]]
+            )
+        return row
+
+    def securable_get(self, body):
+        where = body.get("find", {}).get("where", {})
+        includes = json.dumps(body.get("find", {}).get("include", []))
+        rows = []
+        for securable in self.securables.values():
+            if any(
+                field in where and securable.get(field) != where[field]
+                for field in ["id", "type", "source_sheet"]
+            ):
+                continue
+            if securable["type"] == "dataset":
+                rows.append(self.dataset_row(securable, "Column" in includes))
+            else:
+                row = {
+                    key: value
+                    for key, value in securable.items()
+                    if key != "dataset_ids"
+                }
+                row["datasets"] = [
+                    self.dataset_row(self.securables[dataset_id], "Column" in includes)
+                    for dataset_id in securable["dataset_ids"]
+                ]
+                rows.append(row)
+        return {"count": len(rows), "rows": rows}
+
+    def securable_create(self, body):
+        securable_id = seeded_id(self.rng)
+        properties = body.get("properties", {})
+        self.securables[securable_id] = {
+            "id": securable_id,
+            "type": properties.get("type", "dashboard"),
+            "name": properties.get("name", {}),
+            "dataset_ids": [],
+            "contents": properties.get("contents", {}),
+            "css": properties.get("css", ""),
+            "updated_at": self.now(),
+        }
+        return {"id": securable_id}
+
+    def column_get(self, body):
+        find = body.get("find", {})
+        where = find.get("where", {})
+        if "id" in where:
+            rows = [self.column_row(where["id"])]
+        else:
+            rows = [
+                self.column_row(column_id)
+                for column_id in self.securables[where["securable_id"]]["column_ids"]
+            ]
+        count = len(rows)
+        offset = find.get("offset", 0)
+        limit = find.get("limit", count)
+        return {"count": count, "rows": rows[offset : offset + limit]}
+
+    def column_update(self, body):
+        column = self.columns[body["id"]]
+        column.update(body.get("properties", {}))
+        column["updated_at"] = self.now()
+        return self.column_row(body["id"])
+
+    def hierarchy_get(self, body):
+        where = body.get("find", {}).get("where", {})
+        column_ids = where["column_id"]
+        if isinstance(column_ids, dict):
+            column_ids = column_ids["in"]
+        else:
+            column_ids = [column_ids]
+        return [
+            {
+                "id": None,
+                "column_id": column_id,
+                "name": {"en": "All"},
+                "children": self.hierarchies.get(column_id, []),
+            }
+            for column_id in column_ids
+            if column_id in self.columns
+        ]
+
+    def hierarchy_update(self, body):
+        values = {
+            value["id"]: value for value in self.hierarchies.get(body["id"], [])
+        }
+        for update in body.get("properties", {}).get("updates", []):
+            values[update["id"]] = dict(values.get(update["id"], {}), **update)
+        # Like the column's other properties, updated_at is left alone: the
+        # cloner cannot rely on hierarchy edits showing up in it
+        self.hierarchies[body["id"]] = list(values.values())
+        return {"id": body["id"], "updated": len(body["properties"]["updates"])}
+
+    def dataprovider_create(self, body):
+        datasets = body.get("properties", {}).get("datasets", [])
+        return {
+            "data": [
+                {"id": self.add_dataset(source_sheet)} for source_sheet in datasets
+            ]
+        }
+
+    def acceleration_create(self, body):
+        return {"id": seeded_id(self.rng), "properties": body.get("properties", {})}
+
+    def acceleration_associate(self, body):
+        return {"id": body["id"], "resource": body.get("resource", {})}
+
+    def collection_create(self, body):
+        return {"id": seeded_id(self.rng), "properties": body.get("properties", {})}
+
+    def collection_associate(self, body):
+        return {"id": body["id"], "resource": body.get("resource", {})}
+
+    # Inspection
+
+    async def list_datasets(self, request):
+        return web.json_response(
+            {
+                securable_type: [
+                    securable_id
+                    for securable_id, securable in self.securables.items()
+                    if securable["type"] == securable_type
+                ]
+                for securable_type in ["dataset", "dashboard"]
+            }
+        )
+
+    async def stats_summary(self, request):
+        return web.json_response(
+            {"settings": self.settings, "requests": dict(self.stats)}
+        )
+
+
+def build_app(settings=None):
+    stub = LuzmoStub(dict(DEFAULT_SETTINGS, **(settings or {})))
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/0.1.0/{resource}", stub.handle)
+    app.router.add_get("/_stub/datasets", stub.list_datasets)
+    app.router.add_get("/_stub/stats", stub.stats_summary)
+    app["stub"] = stub
+    return app
+
+
+def parse_settings(argv=None):
+    parser = argparse.ArgumentParser(description="Local Luzmo API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    for name, default in DEFAULT_SETTINGS.items():
+        parser.add_argument(
+            "--" + name.replace("_", "-"), type=type(default), default=default
+        )
+    args = vars(parser.parse_args(argv))
+    return args.pop("host"), args.pop("port"), args
+
+
+if __name__ == "__main__":
+    host, port, settings = parse_settings()
+    web.run_app(build_app(settings), host=host, port=port)